@@ -0,0 +1,117 @@
+import os
+import random
+import argparse
+from typing import Dict
+
+# Call sites a generated file with matches gets, per language and library
+LLM_SNIPPETS = {
+    'python': [
+        ('from openai import OpenAI\n', 'client = OpenAI()\n', 'client.chat.completions.create(model="gpt-4", messages=messages)\n'),
+        ('import anthropic\n', 'ac = anthropic.Anthropic()\n', 'ac.messages.create(model="claude", max_tokens=256, messages=messages)\n'),
+        ('from mistralai.client import MistralClient\n', 'mc = MistralClient(api_key=key)\n', 'mc.chat(model="mistral-large", messages=messages)\n'),
+    ],
+    'javascript': [
+        ("import OpenAI from 'openai';\n", 'const client = new OpenAI();\n', 'await client.chat.completions.create({ model: "gpt-4", messages });\n'),
+        ("import Anthropic from '@anthropic-ai/sdk';\n", 'const ac = new Anthropic();\n', 'await ac.messages.create({ model: "claude", messages });\n'),
+        ("import MistralClient from '@mistralai/mistralai';\n", 'const mc = new MistralClient(key);\n', 'await mc.chat({ model: "mistral-large", messages });\n'),
+    ],
+}
+
+EXTENSIONS = {'python': '.py', 'javascript': '.js'}
+
+
+def _filler(language: str, n: int) -> str:
+    # A small function that none of the scanner's patterns match
+    if language == 'python':
+        return f'def handler_{n}(request, retries=3):\n    value = request.get("field_{n}", {n})\n    return value * retries\n\n'
+    return f'function handler{n}(request, retries = 3) {{\n  const value = request.field{n} || {n};\n  return value * retries;\n}}\n\n'
+
+
+def _file_content(language: str, size: int, with_matches: bool, calls_per_file: int, rnd: random.Random) -> str:
+    parts = []
+    calls = []
+    if with_matches:
+        for import_line, init_line, call_line in rnd.sample(LLM_SNIPPETS[language], rnd.randint(1, len(LLM_SNIPPETS[language]))):
+            parts += [import_line, init_line]
+            calls += [call_line] * calls_per_file
+    length = sum(len(part) for part in parts)
+    n = 0
+    while length < size:
+        filler = _filler(language, n)
+        # Spread the call sites through the file rather than bunching them up
+        if calls and rnd.random() < 0.3:
+            filler += calls.pop()
+        parts.append(filler)
+        length += len(filler)
+        n += 1
+    return ''.join(parts + calls)
+
+
+def _write(path: str, content: str) -> int:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+    return len(content)
+
+
+def generate_repo(path: str, files: int = 1000, file_size: int = 4096, match_density: float = 0.05, calls_per_file: int = 3,
+                  python_share: float = 0.5, codeowners_rules: int = 100, files_per_dir: int = 20,
+                  vendored_files: int = 0, vendored_depth: int = 5, seed: int = 0) -> Dict:
+    # Writes a synthetic repo to path and returns what's in it. match_density is the
+    # share of files that use an LLM library, python_share the share of files that are
+    # Python rather than JavaScript. vendored_files go into a node_modules tree nested
+    # vendored_depth levels deep, which the scanner should never descend into.
+    rnd = random.Random(seed)
+    summary = {'files': 0, 'bytes': 0, 'files_with_matches': 0, 'vendored_files': 0, 'codeowners_rules': codeowners_rules}
+    dir_count = max(1, files // files_per_dir)
+    for index in range(files):
+        language = 'python' if rnd.random() < python_share else 'javascript'
+        with_matches = rnd.random() < match_density
+        file_path = os.path.join(path, f'pkg{index % dir_count // 10}', f'mod{index % dir_count}', f'file{index}{EXTENSIONS[language]}')
+        # File sizes vary around the requested size
+        size = int(file_size * rnd.uniform(0.5, 1.5))
+        summary['bytes'] += _write(file_path, _file_content(language, size, with_matches, calls_per_file, rnd))
+        summary['files'] += 1
+        summary['files_with_matches'] += with_matches
+
+    for index in range(vendored_files):
+        nesting = [part for level in range(index % vendored_depth + 1) for part in ('node_modules', f'dep{level}')]
+        file_path = os.path.join(path, *nesting, f'index{index}.js')
+        _write(file_path, _file_content('javascript', file_size, rnd.random() < match_density, calls_per_file, rnd))
+        summary['vendored_files'] += 1
+
+    # A mix of the rule shapes real CODEOWNERS files use, most specific last
+    rules = ['* @org/everyone']
+    for index in range(codeowners_rules - 1):
+        shape = index % 4
+        if shape == 0:
+            rules.append(f'/pkg{index % max(1, dir_count // 10)}/ @org/team{index}')
+        elif shape == 1:
+            rules.append(f'/pkg{index % max(1, dir_count // 10)}/mod{index % dir_count}/ @org/team{index}')
+        elif shape == 2:
+            rules.append(f'*.{rnd.choice(["py", "js", "md", "json"])} @org/lang{index}')
+        else:
+            rules.append(f'**/mod{index % dir_count}/*.py dev{index}@example.com')
+    _write(os.path.join(path, '.github', 'CODEOWNERS'), '\n'.join(rules) + '\n')
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a synthetic repository for benchmarking llmaudit.')
+    parser.add_argument('path', help='Directory to write the repository to')
+    parser.add_argument('--files', type=int, default=1000, help='Number of source files (default: 1000)')
+    parser.add_argument('--file-size', type=int, default=4096, help='Average file size in bytes (default: 4096)')
+    parser.add_argument('--match-density', type=float, default=0.05, help='Share of files that use an LLM library (default: 0.05)')
+    parser.add_argument('--calls-per-file', type=int, default=3, help='Call sites per library in a file that uses it (default: 3)')
+    parser.add_argument('--python-share', type=float, default=0.5, help='Share of files that are Python rather than JavaScript (default: 0.5)')
+    parser.add_argument('--codeowners-rules', type=int, default=100, help='Number of CODEOWNERS rules (default: 100)')
+    parser.add_argument('--vendored-files', type=int, default=0, help='Number of files in a nested node_modules tree (default: 0)')
+    parser.add_argument('--vendored-depth', type=int, default=5, help='How deep the node_modules tree nests (default: 5)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed gives the same repository (default: 0)')
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        print(f"The folder '{args.path}' already exists. Exiting...")
+        exit()
+    print(generate_repo(args.path, args.files, args.file_size, args.match_density, args.calls_per_file, args.python_share,
+                        args.codeowners_rules, vendored_files=args.vendored_files, vendored_depth=args.vendored_depth, seed=args.seed))
@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import datetime
+import resource
+import tempfile
+import subprocess
+from typing import Dict, List
+from benchmarks.generate_repo import generate_repo
+from llmaudit.findings import CsvSink, RunStats, UsageStats
+from llmaudit.report import generate_report
+from llmaudit.sprawl import CODEOWNERS_PATHS, LLMUsageScanner
+
+# The checkout this file is in, so the llmaudit benchmarked is this one rather than an installed one
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _find_codeowners(repo: str) -> str:
+    for potential_path in CODEOWNERS_PATHS:
+        full_path = os.path.join(repo, potential_path)
+        if os.path.exists(full_path):
+            return full_path
+    return None
+
+
+def time_phases(repo: str) -> Dict:
+    # Times each phase of a serial scan on its own. Writes the CSV and report under
+    # the current directory.
+    phases = {}
+    scanner = LLMUsageScanner(root_dir=repo, codeowners_path=_find_codeowners(repo))
+
+    start = time.perf_counter()
+    files = [(file_path, language) for file_path, language, _ in scanner._iter_files()]
+    phases['walk'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    total_bytes = 0
+    for file_path, _ in files:
+        with open(file_path, 'rb') as file:
+            total_bytes += len(file.read())
+    phases['read'] = time.perf_counter() - start
+
+    # Files are in the page cache after the read phase, so this is mostly matching
+    start = time.perf_counter()
+    file_results = [(file_path, scanner._match_file(file_path, language)[0]) for file_path, language in files]
+    phases['match'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    findings = [finding for file_path, compact_results in file_results
+                for finding in scanner._file_findings(file_path, compact_results)]
+    phases['owners'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sink = CsvSink(os.path.join('results', CsvSink.file_name))
+    for finding in findings:
+        sink.write(finding)
+    sink.close()
+    phases['csv'] = time.perf_counter() - start
+
+    usage_stats = UsageStats()
+    for finding in findings:
+        usage_stats.add(finding)
+    run_stats = RunStats()
+    run_stats.add_repo(repo, usage_stats.as_tuple())
+    start = time.perf_counter()
+    generate_report(run_stats)
+    phases['report'] = time.perf_counter() - start
+
+    return {'phases': phases, 'files': len(files), 'bytes': total_bytes, 'findings': len(findings)}
+
+
+def time_end_to_end(repo: str, jobs: int) -> Dict:
+    # Runs a full scan in a fresh process, so its peak RSS isn't inflated by the phase
+    # benchmarks. Worker processes are waited for by the scan process, so their peak
+    # RSS is included in RUSAGE_CHILDREN too.
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT_DIR, os.environ.get('PYTHONPATH')])))
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-m', 'llmaudit.sprawl', repo, '--jobs', str(jobs)], env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    seconds = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    return {'seconds': seconds, 'peak_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_benchmark(repo: str, repeat: int = 3, jobs: int = 1) -> Dict:
+    # Best of repeat runs for each phase and for the end to end scan
+    repo = os.path.abspath(repo)
+    work_dir = tempfile.mkdtemp(prefix='llmaudit_bench_')
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        runs = []
+        end_to_end = []
+        for _ in range(repeat):
+            runs.append(time_phases(repo))
+            shutil.rmtree('results')
+            end_to_end.append(time_end_to_end(repo, jobs))
+            shutil.rmtree('results')
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    phases = {phase: min(run['phases'][phase] for run in runs) for phase in runs[0]['phases']}
+    seconds = min(run['seconds'] for run in end_to_end)
+    files, total_bytes = runs[0]['files'], runs[0]['bytes']
+    return {
+        'files': files,
+        'bytes': total_bytes,
+        'findings': runs[0]['findings'],
+        'phases': phases,
+        'end_to_end': {
+            'jobs': jobs,
+            'seconds': seconds,
+            'files_per_sec': files / seconds,
+            'mb_per_sec': total_bytes / 1024 / 1024 / seconds,
+            'peak_rss_mb': max(run['peak_rss_mb'] for run in end_to_end),
+        },
+    }
+
+
+def compare(result: Dict, baseline: Dict) -> List[str]:
+    # One line per timing: baseline, now and how many times slower (>1) or faster (<1)
+    lines = []
+    timings = [(f'phase {phase}', baseline['phases'].get(phase), seconds) for phase, seconds in result['phases'].items()]
+    timings.append(('end to end', baseline['end_to_end']['seconds'], result['end_to_end']['seconds']))
+    for name, before, after in timings:
+        if before:
+            lines.append(f"{name}: {before:.3f}s -> {after:.3f}s ({after / before:.2f}x)")
+    lines.append(f"peak RSS: {baseline['end_to_end']['peak_rss_mb']:.1f}MB -> {result['end_to_end']['peak_rss_mb']:.1f}MB")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark llmaudit on a synthetic (or existing) repository and print the timings as JSON.')
+    parser.add_argument('--repo', help='Benchmark this repository instead of generating one')
+    parser.add_argument('--files', type=int, default=2000, help='Number of source files to generate (default: 2000)')
+    parser.add_argument('--file-size', type=int, default=4096, help='Average generated file size in bytes (default: 4096)')
+    parser.add_argument('--match-density', type=float, default=0.05, help='Share of generated files that use an LLM library (default: 0.05)')
+    parser.add_argument('--calls-per-file', type=int, default=3, help='Call sites per library in a file that uses it (default: 3)')
+    parser.add_argument('--python-share', type=float, default=0.5, help='Share of generated files that are Python rather than JavaScript (default: 0.5)')
+    parser.add_argument('--codeowners-rules', type=int, default=100, help='Number of generated CODEOWNERS rules (default: 100)')
+    parser.add_argument('--vendored-files', type=int, default=500, help='Number of generated files in a nested node_modules tree (default: 500)')
+    parser.add_argument('--vendored-depth', type=int, default=5, help='How deep the node_modules tree nests (default: 5)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the generated repository (default: 0)')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs, the fastest of which is reported (default: 3)')
+    parser.add_argument('--jobs', type=int, default=1, help='--jobs for the end to end scan (default: 1)')
+    parser.add_argument('--output', help='Also write the JSON to this file')
+    parser.add_argument('--compare', help='JSON from an earlier run to compare the timings with')
+    args = parser.parse_args()
+
+    shape = None
+    temp_dir = None
+    repo = args.repo
+    if repo is None:
+        temp_dir = tempfile.mkdtemp(prefix='llmaudit_bench_repo_')
+        repo = os.path.join(temp_dir, 'repo')
+        shape = generate_repo(repo, args.files, args.file_size, args.match_density, args.calls_per_file, args.python_share,
+                              args.codeowners_rules, vendored_files=args.vendored_files, vendored_depth=args.vendored_depth,
+                              seed=args.seed)
+    try:
+        result = run_benchmark(repo, args.repeat, args.jobs)
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    result = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repo': args.repo,
+        'generated': shape and dict(shape, file_size=args.file_size, match_density=args.match_density,
+                                    calls_per_file=args.calls_per_file, python_share=args.python_share,
+                                    vendored_depth=args.vendored_depth, seed=args.seed),
+        **result,
+    }
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for line in compare(result, baseline):
+            print(line, file=sys.stderr)
@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import git
+from typing import Dict, List, Optional, Tuple
+
+# Bump whenever a change to the scanner changes what it finds in the same content,
+# so results cached by older versions aren't served
+CACHE_VERSION = 3
+
+
+def git_blob_id(file_path: str) -> str:
+    # Same id git gives the file's content, so a checkout's index can be used as the
+    # cache key instead of hashing every file
+    with open(file_path, 'rb') as file:
+        data = file.read()
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+
+def git_index_blob_ids(repo_path: str) -> Dict[str, str]:
+    # Path relative to repo_path -> blob id, for every regular file in the repo's
+    # index. Only valid for a clean checkout, where the index matches the working tree.
+    try:
+        output = git.Repo(repo_path).git.ls_files('-s', '-z')
+    except Exception as e:
+        print(f"Unable to read the git index of {repo_path}, hashing files instead: {e}")
+        return {}
+    blob_ids = {}
+    for entry in output.split('\0'):
+        if not entry:
+            continue
+        info, path = entry.split('\t', 1)
+        mode, blob_id, _ = info.split(' ')
+        # Skip symlinks and submodules, their ids aren't of the content os.walk finds
+        if mode in ('100644', '100755'):
+            blob_ids[path] = blob_id
+    return blob_ids
+
+
+def config_fingerprint(language_configs: Dict) -> str:
+    config = json.dumps(language_configs, sort_keys=True)
+    return hashlib.sha256(f'{CACHE_VERSION}:{config}'.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    # SQLite store of each file's compact scan results and skip reason (see
+    # LLMUsageScanner._match_file), keyed by the git blob id of its content plus a
+    # fingerprint of the language configs. Entries from other fingerprints are dropped
+    # on open, and the least recently used entries beyond max_entries are evicted on close.
+    def __init__(self, path: str, language_configs: Dict, max_entries: int = 1000000, read_only: bool = False):
+        self.path = path
+        self.fingerprint = config_fingerprint(language_configs)
+        self.max_entries = max_entries
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        self._pending_puts = []
+        self._pending_touches = []
+
+        if read_only:
+            self.connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True, timeout=30)
+            return
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30)
+        # WAL lets scan worker processes read while this connection writes
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS results (
+                                       blob_id TEXT NOT NULL,
+                                       language TEXT NOT NULL,
+                                       fingerprint TEXT NOT NULL,
+                                       results TEXT NOT NULL,
+                                       last_used REAL NOT NULL,
+                                       PRIMARY KEY (blob_id, language, fingerprint))''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+        deleted = self.connection.execute('DELETE FROM results WHERE fingerprint != ?', (self.fingerprint,)).rowcount
+        if deleted:
+            print(f"Scan patterns changed, dropped {deleted} cached results")
+        self.connection.commit()
+
+    def get(self, blob_id: str, language: str) -> Optional[Tuple[List[Tuple], str]]:
+        row = self.connection.execute('SELECT results FROM results WHERE blob_id = ? AND language = ? AND fingerprint = ?',
+                                      (blob_id, language, self.fingerprint)).fetchone()
+        if row is None:
+            return None
+        compact_results, skip_reason = json.loads(row[0])
+        return [tuple(result) for result in compact_results], skip_reason
+
+    def record(self, blob_id: str, language: str, compact_results: List[Tuple], skip_reason: str, from_cache: bool):
+        # Writes are batched, and hits only refresh last_used for eviction
+        if from_cache:
+            self.hits += 1
+            self._pending_touches.append((time.time(), blob_id, language, self.fingerprint))
+        else:
+            self.misses += 1
+            self._pending_puts.append((blob_id, language, self.fingerprint, json.dumps([compact_results, skip_reason]), time.time()))
+        if len(self._pending_puts) + len(self._pending_touches) >= 1000:
+            self.flush()
+
+    def flush(self):
+        if self.read_only:
+            return
+        self.connection.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)', self._pending_puts)
+        self.connection.executemany('UPDATE results SET last_used = ? WHERE blob_id = ? AND language = ? AND fingerprint = ?',
+                                    self._pending_touches)
+        self.connection.commit()
+        self._pending_puts = []
+        self._pending_touches = []
+
+    def close(self):
+        if not self.read_only:
+            self.flush()
+            count = self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+            if count > self.max_entries:
+                self.connection.execute('DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY last_used LIMIT ?)',
+                                        (count - self.max_entries,))
+                self.connection.commit()
+            print(f"Result cache: {self.hits} files served from cache, {self.misses} scanned")
+        self.connection.close()
@@ -1,5 +1,6 @@
+import sys
 import argparse
-from llmaudit import scan_github_repos, sprawl
+from llmaudit import diff, discovery, report, scan_github_repos, sprawl
 
 def main_cli():
     parser = argparse.ArgumentParser(description="CLI tool to scan GitHub repos or run sprawl locally.")
@@ -11,21 +12,52 @@ def main_cli():
     github_parser.add_argument('--temp-dir', default='llm_usage_temp', help='Specify the temporary directory to clone repositories into (default: llm_usage_temp)')
     github_parser.add_argument('--keep', action='store_true', help='Keep the temporary folder after cloning (default: False, will delete)')
     github_parser.add_argument('--timeout', type=int, default=300, help='Timeout for cloning each repository in seconds (default: 300)')  # Add timeout argument
+    github_parser.add_argument('--clone-workers', type=int, default=4, help='Number of repositories to clone concurrently (default: 4)')
+    github_parser.add_argument('--max-in-flight', type=int, default=8, help='Maximum number of repositories cloning or waiting to be scanned at once, which caps temp disk usage (default: 8)')
+    github_parser.add_argument('--clone-strategy', choices=list(scan_github_repos.CLONE_STRATEGIES), default='sparse', help='How much of each repository to clone: full history, shallow (latest commit), blobless (no file contents outside the checkout) or sparse (latest commit, scanned files only) (default: sparse)')
+    github_parser.add_argument('--mirror-dir', help='Keep mirror clones of the repositories in this directory across runs, and scan them without a checkout')
+    github_parser.add_argument('--ref', help='Branch, tag or commit to scan in each mirror (default: HEAD, the default branch)')
+    discovery.add_discovery_arguments(github_parser)
+    sprawl.add_scan_arguments(github_parser)
 
 
     # Subparser for running sprawl locally
     local_parser = subparsers.add_parser('local', help='Run sprawl locally')
     local_parser.add_argument('--repos', nargs='+', required=True, help='Root directory of the repo(s) to scan')
+    local_parser.add_argument('--ref', help='Scan this branch, tag or commit straight from the git object database instead of the working tree, the repos can be bare clones')
+    sprawl.add_scan_arguments(local_parser)
+
+    # Subparser for auditing only what changed between two refs
+    diff_parser = subparsers.add_parser('diff', help='Report the LLM call sites added and removed between two git refs')
+    diff.add_diff_arguments(diff_parser)
+
+    # Subparser for rendering a saved run's report again
+    report_parser = subparsers.add_parser('report', help='Render the report of a saved run without rescanning')
+    report.add_report_arguments(report_parser)
     
 
     args = parser.parse_args()
 
+    if args.command == 'github' and args.ref and not args.mirror_dir:
+        github_parser.error('--ref requires --mirror-dir')
+
     if args.command == 'github':
         # Assuming scan_github_repos.main() accepts command line arguments directly
-        scan_github_repos.scan_repos(args.temp_dir, args.keep, args.timeout, args.repos)
+        scan_github_repos.scan_repos(args.temp_dir, args.keep, args.timeout, args.repos, args.jobs, args.clone_workers,
+                                     args.max_in_flight, args.clone_strategy, args.cache, args.cache_max_entries,
+                                     sprawl.walker_options_from_args(args), args.output_format, args.mirror_dir,
+                                     args.ref or 'HEAD', args.metrics, args.profile, args.resume,
+                                     discovery.lister_options_from_args(args), args.api_url)
     elif args.command == 'local':
         # Assuming sprawl.main() accepts command line arguments directly
-        sprawl.run_llm_usage_scanner(args.repos)
+        sprawl.run_llm_usage_scanner(args.repos, jobs=args.jobs, cache_path=args.cache, cache_max_entries=args.cache_max_entries,
+                                     walker_options=sprawl.walker_options_from_args(args), output_formats=args.output_format,
+                                     git_ref=args.ref, metrics_path=args.metrics, profile_path=args.profile,
+                                     resume=args.resume)
+    elif args.command == 'diff':
+        sys.exit(diff.run_diff_from_args(args))
+    elif args.command == 'report':
+        sys.exit(report.run_report_from_args(args))
 
 if __name__ == "__main__":
     main_cli()
\ No newline at end of file
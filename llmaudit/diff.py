@@ -0,0 +1,144 @@
+import os
+import sys
+import json
+import argparse
+import git
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from llmaudit import sprawl
+from llmaudit.findings import Finding
+from llmaudit.gitobjects import blob_size, changed_files, find_in_tree, merge_base, read_blob, resolve_ref
+from llmaudit.walker import FileWalker, decode_source
+
+# Only the files that changed between two refs are matched, so a pull request can be
+# audited in about the time it takes git to diff the two trees
+
+
+class RefScanner:
+    # Scans single files of one ref, with that ref's CODEOWNERS and the file filtering
+    # rules
+    def __init__(self, repo_path: str, ref: str, files: List[Tuple[str, str]], walker_options: Dict = None):
+        repo = git.Repo(repo_path)
+        self.ref = ref
+        self.scanner = sprawl.LLMUsageScanner(root_dir=repo_path, codeowners_path=find_in_tree(repo, ref, sprawl.CODEOWNERS_PATHS),
+                                              git_ref=ref)
+        self.repo = self.scanner.git_repo
+        extensions = [ext for config in self.scanner.language_configs.values() for ext in config['extensions']]
+        self.walker = FileWalker(repo_path, extensions, **(walker_options or {}))
+        # Only the changed (path, blob id) files go through the walker, listing the whole
+        # tree would take most of the time on a large repo
+        entries = [(path, blob_id, blob_size(self.repo, blob_id)) for path, blob_id in files]
+        self.blob_ids = dict(self.walker.walk_tree(entries))
+
+    def findings(self, path: Optional[str]) -> List[Tuple[Finding, str]]:
+        # (finding, stripped text of its line) for every call site in path, if the file
+        # exists in this ref and isn't filtered out
+        blob_id = self.blob_ids.get(path)
+        if blob_id is None:
+            return []
+        data = read_blob(self.repo, blob_id)
+        lines = None
+        found = []
+        for language, config in self.scanner.language_configs.items():
+            if not any(path.endswith(ext) for ext in config['extensions']):
+                continue
+            compact_results, _ = self.scanner._match_data(data, language)
+            if compact_results and lines is None:
+                lines = decode_source(data).split('\n')
+            # Owners are looked up by the path in the repo, which is also what's reported
+            for finding in self.scanner._file_findings(os.path.join(self.scanner.root_dir, path), compact_results):
+                found.append((finding._replace(file_path=path), lines[finding.line - 1].strip()))
+        return found
+
+
+def _changed(before: List[Tuple[Finding, str]], after: List[Tuple[Finding, str]]) -> List[Tuple[Finding, str]]:
+    # The call sites in after that aren't in before. Call sites are compared by library,
+    # label and line text rather than line number, so code moving within a file isn't
+    # a change, and as a multiset, so a second identical call is.
+    remaining = Counter((finding.library, finding.label, text) for finding, text in before)
+    changed = []
+    for finding, text in after:
+        key = (finding.library, finding.label, text)
+        if remaining[key]:
+            remaining[key] -= 1
+        else:
+            changed.append((finding, text))
+    return changed
+
+
+def diff_refs(repo_path: str, base: str, head: str = 'HEAD', walker_options: Dict = None,
+              use_merge_base: bool = True) -> Tuple[List[Tuple[Finding, str]], List[Tuple[Finding, str]]]:
+    # Returns the (added, removed) call sites of head relative to base. Like a pull
+    # request's diff, base is the merge base of the two refs unless use_merge_base is off.
+    repo = git.Repo(repo_path)
+    for ref in (base, head):
+        if resolve_ref(repo, ref) is None:
+            raise ValueError(f"{ref} is not a commit in {repo_path}")
+    if use_merge_base:
+        base = merge_base(repo, base, head) or base
+
+    changes = changed_files(repo, base, head)
+    base_scanner = RefScanner(repo_path, base, [old for old, _ in changes if old], walker_options)
+    head_scanner = RefScanner(repo_path, head, [new for _, new in changes if new], walker_options)
+    added = []
+    removed = []
+    for old, new in changes:
+        before = base_scanner.findings(old and old[0])
+        after = head_scanner.findings(new and new[0])
+        added += _changed(before, after)
+        removed += _changed(after, before)
+    return added, removed
+
+
+def _describe(finding: Finding, text: str) -> str:
+    return f"{finding.file_path}:{finding.line} {finding.label} {finding.owners}\n      {text}"
+
+
+def run_diff(repo_path: str, base: str, head: str = 'HEAD', walker_options: Dict = None, use_merge_base: bool = True,
+             json_path: str = None, fail_on_added: bool = False) -> int:
+    # Prints the added and removed call sites and returns the exit code
+    try:
+        added, removed = diff_refs(repo_path, base, head, walker_options, use_merge_base)
+    except (ValueError, git.GitCommandError) as e:
+        print(f"Error: {e}")
+        return 2
+
+    print(f"Added LLM call sites ({len(added)}):")
+    for finding, text in added:
+        print("  + " + _describe(finding, text))
+    print(f"Removed LLM call sites ({len(removed)}):")
+    for finding, text in removed:
+        print("  - " + _describe(finding, text))
+
+    if json_path:
+        if os.path.dirname(json_path):
+            os.makedirs(os.path.dirname(json_path), exist_ok=True)
+        with open(json_path, 'w') as f:
+            json.dump({'base': base, 'head': head,
+                       'added': [dict(finding._asdict(), code=text) for finding, text in added],
+                       'removed': [dict(finding._asdict(), code=text) for finding, text in removed]}, f, indent=2)
+
+    return 1 if fail_on_added and added else 0
+
+
+def add_diff_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--repo', default='.', help='Path to the git repository (default: the current directory)')
+    parser.add_argument('--base', required=True, help='Branch, tag or commit to compare against, e.g. the pull request\'s target branch')
+    parser.add_argument('--head', default='HEAD', help='Branch, tag or commit with the changes (default: HEAD)')
+    parser.add_argument('--no-merge-base', action='store_true', help='Compare with base itself rather than the merge base of base and head')
+    parser.add_argument('--json', help='Also write the added and removed call sites to this JSON file')
+    parser.add_argument('--fail-on-added', action='store_true', help='Exit with status 1 if any LLM call sites were added')
+    sprawl.add_walker_arguments(parser)
+
+
+def run_diff_from_args(args: argparse.Namespace) -> int:
+    return run_diff(args.repo, args.base, args.head, sprawl.walker_options_from_args(args), not args.no_merge_base, args.json,
+                    args.fail_on_added)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Report the LLM call sites added and removed between two git refs.')
+    add_diff_arguments(parser)
+    args = parser.parse_args()
+
+    sys.exit(run_diff_from_args(args))
@@ -0,0 +1,270 @@
+import os
+import re
+import json
+import time
+import argparse
+import datetime
+import threading
+import http.client
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Lists the repos to scan straight from the GitHub REST API. The base URL is
+# configurable for GitHub Enterprise (https://<host>/api/v3) and for testing against
+# a local stand-in for the API.
+DEFAULT_API_URL = 'https://api.github.com'
+# The most the list endpoints return per page
+PER_PAGE = 100
+DEFAULT_PAGE_WORKERS = 4
+DEFAULT_MAX_RETRIES = 5
+# Rate limited requests are retried after waiting at least 1s, doubling with each
+# rate limited response in a row up to a minute, and fail after this many in a row
+DEFAULT_MAX_RATE_LIMIT_RETRIES = 10
+MAX_RATE_LIMIT_BACKOFF = 60
+
+
+class GitHubError(Exception):
+    pass
+
+
+class RateLimiter:
+    # Shared by every thread talking to the API. Once GitHub says the rate limit is
+    # used up, or asks to retry after a while, every request waits until then.
+    def __init__(self):
+        self.paused_until = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            delay = self.paused_until - time.time()
+        if delay > 0:
+            print(f"GitHub rate limit reached, waiting {delay:.0f}s")
+            time.sleep(delay)
+
+    def update(self, headers, min_pause: float = 1) -> bool:
+        # Pauses if the response's headers ask for it, returning whether they did. The
+        # pause lasts at least min_pause seconds, so a reset time that has already
+        # passed by the local clock, or a Retry-After of 0, doesn't retry right away.
+        pause_until = 0
+        retry_after = headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            pause_until = time.time() + int(retry_after)
+        elif headers.get('X-RateLimit-Remaining') == '0' and (headers.get('X-RateLimit-Reset') or '').isdigit():
+            # Reset is when the limit's window starts over, in epoch seconds
+            pause_until = int(headers['X-RateLimit-Reset']) + 1
+        if not pause_until:
+            return False
+        pause_until = max(pause_until, time.time() + min_pause)
+        with self._lock:
+            self.paused_until = max(self.paused_until, pause_until)
+        return True
+
+
+class GitHubClient:
+    def __init__(self, token: str = None, api_url: str = DEFAULT_API_URL, timeout: int = 30,
+                 max_retries: int = DEFAULT_MAX_RETRIES, max_rate_limit_retries: int = DEFAULT_MAX_RATE_LIMIT_RETRIES):
+        self.token = token
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.rate_limiter = RateLimiter()
+
+    def get(self, url: str) -> Tuple[object, Dict[str, str]]:
+        # (decoded JSON, response headers) of a GET of url, a full URL or a path under
+        # api_url. Rate limited requests wait as long as GitHub asks and are retried
+        # up to max_rate_limit_retries times in a row, server and network errors and
+        # unreadable responses are retried up to max_retries times. Both back off more
+        # with each retry. Every failure is raised as a GitHubError.
+        if not url.startswith(('http://', 'https://')):
+            url = self.api_url + url
+        headers = {'Accept': 'application/vnd.github+json', 'X-GitHub-Api-Version': '2022-11-28', 'User-Agent': 'llmaudit'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        failures = 0
+        rate_limited = 0
+        while True:
+            self.rate_limiter.wait()
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=self.timeout) as response:
+                    self.rate_limiter.update(response.headers)
+                    return json.load(response), dict(response.headers)
+            except urllib.error.HTTPError as e:
+                if e.code in (403, 429) and self.rate_limiter.update(e.headers, min(2 ** rate_limited, MAX_RATE_LIMIT_BACKOFF)):
+                    if rate_limited >= self.max_rate_limit_retries:
+                        raise GitHubError(f"GET {url} failed: {e.code} {e.reason}, still rate limited after {rate_limited} retries")
+                    rate_limited += 1
+                    continue
+                if e.code < 500 or failures >= self.max_retries:
+                    raise GitHubError(f"GET {url} failed: {e.code} {e.reason}")
+            # URLError covers failures to connect, but a connection dropped or timing out
+            # once the request is sent, or a truncated body, raise their own errors
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                if failures >= self.max_retries:
+                    raise GitHubError(f"GET {url} failed: {getattr(e, 'reason', None) or e!r}")
+            time.sleep(2 ** failures)
+            failures += 1
+
+
+def _link_urls(link_header: Optional[str]) -> Dict[str, str]:
+    # rel -> URL of a Link header, e.g. {'next': ..., 'last': ...}
+    return {rel: url for url, rel in re.findall(r'<([^>]+)>;\s*rel="(\w+)"', link_header or '')}
+
+
+def _with_page(url: str, page: int) -> str:
+    parts = urllib.parse.urlsplit(url)
+    query = dict(urllib.parse.parse_qsl(parts.query))
+    query['page'] = str(page)
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query)))
+
+
+def parse_since(value: str) -> datetime.datetime:
+    # An ISO 8601 date or time, or a time ago like '36h' or '7d', as an aware UTC time
+    match = re.fullmatch(r'(\d+)([hd])', value)
+    if match:
+        hours = int(match.group(1)) * (24 if match.group(2) == 'd' else 1)
+        return datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=hours)
+    since = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return since if since.tzinfo else since.replace(tzinfo=datetime.timezone.utc)
+
+
+def _pushed_at(repo: Dict) -> Optional[datetime.datetime]:
+    return repo.get('pushed_at') and datetime.datetime.fromisoformat(repo['pushed_at'].replace('Z', '+00:00'))
+
+
+class RepoLister:
+    # Lists an organization's, a user's or (by default) the token owner's repos, most
+    # recently pushed first, skipping archived and forked repos unless told not to.
+    # Every skipped repo is counted by reason. The list endpoints can't filter by
+    # archived, language or push time themselves (only the search API can, and it
+    # stops at 1000 results), so those are filtered here, but sorting by push time lets
+    # the listing stop at the first repo pushed before pushed_since. Empty repos are
+    # still listed: GitHub computes a repo's size asynchronously and can report 0 for
+    # one that was just pushed, so they're only told apart once cloned.
+    def __init__(self, client: GitHubClient, org: str = None, user: str = None, repo_type: str = None,
+                 pushed_since: datetime.datetime = None, include_archived: bool = False, include_forks: bool = False,
+                 languages: List[str] = None, page_workers: int = DEFAULT_PAGE_WORKERS):
+        self.client = client
+        self.org = org
+        self.user = user
+        self.repo_type = repo_type
+        self.pushed_since = pushed_since
+        self.include_archived = include_archived
+        self.include_forks = include_forks
+        self.languages = {language.lower() for language in languages} if languages else None
+        self.page_workers = max(1, page_workers)
+        self.skipped = Counter()
+        # Whether the listing stopped at a repo pushed before pushed_since
+        self.reached_pushed_since = False
+
+    def _first_page_url(self) -> str:
+        if self.org:
+            path = f'/orgs/{urllib.parse.quote(self.org)}/repos'
+        elif self.user:
+            path = f'/users/{urllib.parse.quote(self.user)}/repos'
+        else:
+            path = '/user/repos'
+        params = {'per_page': PER_PAGE, 'sort': 'pushed', 'direction': 'desc'}
+        repo_type = self.repo_type
+        # Organizations can leave out forks on the server
+        if self.org and not self.include_forks and repo_type in (None, 'all'):
+            repo_type = 'sources'
+        if repo_type:
+            params['type'] = repo_type
+        return f'{self.client.api_url}{path}?{urllib.parse.urlencode(params)}'
+
+    def _pages(self) -> Iterator[List[Dict]]:
+        # Pages in order. Once the first page's Link header says how many there are,
+        # up to page_workers pages are fetched ahead at a time, and ones still pending
+        # are dropped when the caller stops early.
+        url = self._first_page_url()
+        repos, headers = self.client.get(url)
+        yield repos
+        links = _link_urls(headers.get('Link'))
+        last_page = re.search(r'[?&]page=(\d+)', links.get('last', ''))
+        if not last_page:
+            # No page count to fetch ahead with, so follow the next links one at a time
+            while 'next' in links:
+                repos, headers = self.client.get(links['next'])
+                yield repos
+                links = _link_urls(headers.get('Link'))
+            return
+
+        pending = []
+        pages = iter(range(2, int(last_page.group(1)) + 1))
+        with ThreadPoolExecutor(max_workers=self.page_workers) as pool:
+            try:
+                while True:
+                    while len(pending) < self.page_workers:
+                        page = next(pages, None)
+                        if page is None:
+                            break
+                        pending.append(pool.submit(self.client.get, _with_page(links['last'], page)))
+                    if not pending:
+                        return
+                    yield pending.pop(0).result()[0]
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _skip_reason(self, repo: Dict) -> Optional[str]:
+        if repo.get('archived') and not self.include_archived:
+            return 'archived'
+        if repo.get('fork') and not self.include_forks:
+            return 'fork'
+        if self.languages is not None and (repo.get('language') or '').lower() not in self.languages:
+            return 'language'
+        return None
+
+    def list(self) -> Iterator[Dict]:
+        # Yields the API's JSON object for every repo that passes the filters
+        for repos in self._pages():
+            for repo in repos:
+                if self.pushed_since is not None:
+                    pushed_at = _pushed_at(repo)
+                    if pushed_at is None or pushed_at < self.pushed_since:
+                        # Every repo after this one was pushed even longer ago
+                        self.reached_pushed_since = True
+                        return
+                reason = self._skip_reason(repo)
+                if reason:
+                    self.skipped[reason] += 1
+                    continue
+                yield repo
+
+    def summary(self) -> str:
+        parts = [f"{count} ({reason})" for reason, count in self.skipped.most_common()]
+        if self.reached_pushed_since:
+            parts.append(f"the rest (not pushed since {self.pushed_since.isoformat(timespec='minutes')})")
+        return ', '.join(parts)
+
+
+def add_discovery_arguments(parser: argparse.ArgumentParser):
+    # Options for which GitHub repos are listed, see lister_options_from_args
+    owner = parser.add_mutually_exclusive_group()
+    owner.add_argument('--org', help="Scan this organization's repos instead of the token owner's")
+    owner.add_argument('--user', help="Scan this user's public repos instead of the token owner's")
+    parser.add_argument('--repo-type', help='type filter passed to the GitHub API, e.g. all, public, private, sources or member for organizations and all, owner or member for users')
+    parser.add_argument('--pushed-since', type=parse_since, help='Only scan repos pushed to since this ISO 8601 date or time, or this long ago, e.g. 24h or 7d')
+    parser.add_argument('--languages', nargs='+', help="Only scan repos whose main language, as detected by GitHub, is one of these")
+    parser.add_argument('--include-archived', action='store_true', help='Scan archived repos too')
+    parser.add_argument('--include-forks', action='store_true', help='Scan forked repos too')
+    parser.add_argument('--api-url', default=os.getenv('GITHUB_API_URL', DEFAULT_API_URL), help=f'GitHub API base URL, e.g. https://<host>/api/v3 for GitHub Enterprise (default: $GITHUB_API_URL or {DEFAULT_API_URL})')
+    parser.add_argument('--page-workers', type=int, default=DEFAULT_PAGE_WORKERS, help=f'Number of pages of the repo list to fetch concurrently (default: {DEFAULT_PAGE_WORKERS})')
+
+
+def lister_options_from_args(args: argparse.Namespace) -> Dict:
+    return {
+        'org': args.org,
+        'user': args.user,
+        'repo_type': args.repo_type,
+        'pushed_since': args.pushed_since,
+        'include_archived': args.include_archived,
+        'include_forks': args.include_forks,
+        'languages': args.languages,
+        'page_workers': args.page_workers,
+    }
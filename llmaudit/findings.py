@@ -0,0 +1,186 @@
+import os
+import csv
+import json
+import shutil
+import sqlite3
+from typing import Dict, List, NamedTuple, Tuple
+
+DEFAULT_RESULTS_DIR = 'results'
+
+
+class Finding(NamedTuple):
+    # One LLM call site. A tuple rather than a dict to keep millions of them cheap.
+    library: str
+    file_path: str
+    line: int
+    pattern: str
+    label: str
+    owners: List[Tuple[str, str]]
+    exact_match: bool
+
+
+class UsageStats:
+    # Library and owner counts for one repo, updated as findings stream past
+    def __init__(self):
+        self.total_results = 0
+        self.library_counts = {}
+        self.owner_counts = {}
+
+    def add(self, finding: Finding):
+        self.total_results += 1
+        self.library_counts[finding.library] = self.library_counts.get(finding.library, 0) + 1
+        for owner in finding.owners:
+            if isinstance(owner, tuple):
+                owner = ', '.join(owner)  # Convert tuple to string if necessary
+            self.owner_counts[owner] = self.owner_counts.get(owner, 0) + 1
+
+    def as_tuple(self) -> Tuple[int, Dict[str, int], Dict[str, int]]:
+        return self.total_results, self.library_counts, self.owner_counts
+
+
+class RunStats:
+    # Usage across every repo of a run, updated as each repo's scan completes so the
+    # report doesn't have to add up every repo again at the end
+    def __init__(self):
+        self.total_usages = 0
+        self.library_counts = {}
+        # Owner -> [usages, repos]
+        self.owner_counts = {}
+        # Repo -> its UsageStats.as_tuple()
+        self.repos = {}
+
+    def add_repo(self, repo: str, stats: Tuple[int, Dict[str, int], Dict[str, int]]):
+        # A repo added again replaces its earlier stats
+        self.remove_repo(repo)
+        self.repos[repo] = stats
+        self._count(stats, 1)
+
+    def remove_repo(self, repo: str):
+        if repo in self.repos:
+            self._count(self.repos.pop(repo), -1)
+
+    def _count(self, stats: Tuple[int, Dict[str, int], Dict[str, int]], sign: int):
+        total_usages, library_counts, owner_counts = stats
+        self.total_usages += sign * total_usages
+        for library, count in library_counts.items():
+            self.library_counts[library] = self.library_counts.get(library, 0) + sign * count
+        for owner, count in owner_counts.items():
+            owner_stats = self.owner_counts.setdefault(owner, [0, 0])
+            owner_stats[0] += sign * count
+            owner_stats[1] += sign
+            if not owner_stats[1]:
+                del self.owner_counts[owner]
+
+
+class CsvSink:
+    # Appends to the CSV across runs, writing the header only when the file is new.
+    # Every sink can also merge files it wrote into a new one, see RunStore.export.
+    file_name = 'results.csv'
+    header = ['Library', 'File Path', 'Line Number', 'Pattern', 'Label', 'Owners', 'Exact Match', 'Secured?']
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        file_exists = os.path.isfile(path)
+        self.file = open(path, mode='a' if file_exists else 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        if not file_exists:
+            self.writer.writerow(self.header)
+
+    def write(self, finding: Finding):
+        self.writer.writerow([finding.library, finding.file_path, finding.line, finding.pattern, finding.label,
+                              finding.owners, finding.exact_match])
+
+    def close(self):
+        self.file.close()
+
+    @classmethod
+    def merge(cls, parts: List[str], path: str):
+        # One header, then every part's rows copied as they are
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', newline='', encoding='utf-8') as merged:
+            csv.writer(merged).writerow(cls.header)
+            for part in parts:
+                with open(part, newline='', encoding='utf-8') as file:
+                    file.readline()
+                    shutil.copyfileobj(file, merged)
+
+
+class JsonLinesSink:
+    # One JSON object per finding, appended across runs
+    file_name = 'results.jsonl'
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.file = open(path, mode='a', encoding='utf-8')
+
+    def write(self, finding: Finding):
+        self.file.write(json.dumps(finding._asdict()) + '\n')
+
+    def close(self):
+        self.file.close()
+
+    @staticmethod
+    def merge(parts: List[str], path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'wb') as merged:
+            for part in parts:
+                with open(part, 'rb') as file:
+                    shutil.copyfileobj(file, merged)
+
+
+class SqliteSink:
+    # Findings table, appended across runs and committed in batches
+    file_name = 'results.sqlite'
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.connection = self._connect(path)
+        self.pending = []
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        connection = sqlite3.connect(path)
+        connection.execute('''CREATE TABLE IF NOT EXISTS findings (
+                                  library TEXT, file_path TEXT, line INTEGER, pattern TEXT,
+                                  label TEXT, owners TEXT, exact_match INTEGER)''')
+        return connection
+
+    def write(self, finding: Finding):
+        self.pending.append(finding._replace(owners=json.dumps(finding.owners)))
+        if len(self.pending) >= 1000:
+            self._flush()
+
+    def _flush(self):
+        self.connection.executemany('INSERT INTO findings VALUES (?, ?, ?, ?, ?, ?, ?)', self.pending)
+        self.connection.commit()
+        self.pending = []
+
+    def close(self):
+        self._flush()
+        self.connection.close()
+
+    @classmethod
+    def merge(cls, parts: List[str], path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if os.path.exists(path):
+            os.remove(path)
+        connection = cls._connect(path)
+        for part in parts:
+            connection.execute('ATTACH DATABASE ? AS part', (part,))
+            connection.execute('INSERT INTO findings SELECT * FROM part.findings')
+            connection.commit()
+            connection.execute('DETACH DATABASE part')
+        connection.close()
+
+
+SINKS = {'csv': CsvSink, 'jsonl': JsonLinesSink, 'sqlite': SqliteSink}
+
+
+def open_sinks(output_formats: List[str] = None, results_dir: str = DEFAULT_RESULTS_DIR) -> List:
+    return [SINKS[output_format](os.path.join(results_dir, SINKS[output_format].file_name))
+            for output_format in output_formats or ['csv']]
+
+
+def close_sinks(sinks: List):
+    for sink in sinks:
+        sink.close()
@@ -0,0 +1,73 @@
+import git
+from typing import List, Optional, Tuple
+
+# Scanning a ref reads the files straight from the git object database, so it works on
+# bare and mirror clones and never writes a checkout to disk
+
+
+def list_tree(repo: git.Repo, ref: str) -> List[Tuple[str, str, int]]:
+    # (path, blob id, size) of every regular file in ref's tree, paths '/' separated
+    output = repo.git.ls_tree('-r', '-l', '-z', ref)
+    entries = []
+    for entry in output.split('\0'):
+        if not entry:
+            continue
+        info, path = entry.split('\t', 1)
+        mode, _, blob_id, size = info.split()
+        # Skip symlinks and submodules, like the working tree walk does
+        if mode in ('100644', '100755'):
+            entries.append((path, blob_id, int(size)))
+    return entries
+
+
+def find_in_tree(repo: git.Repo, ref: str, paths: List[str]) -> Optional[str]:
+    # The first of paths that is a file in ref's tree, or None
+    listed = {entry.split('\t', 1)[1] for entry in repo.git.ls_tree('-z', ref, '--', *paths).split('\0') if entry}
+    return next((path for path in paths if path in listed), None)
+
+
+def read_blob(repo: git.Repo, blob_id: str) -> bytes:
+    # GitPython keeps one `git cat-file --batch` process per repo for these reads
+    return repo.git.get_object_data(blob_id)[3]
+
+
+def resolve_ref(repo: git.Repo, ref: str) -> Optional[str]:
+    # The commit ref points at, or None if it doesn't exist (or the repo is empty)
+    try:
+        return repo.git.rev_parse('--verify', '--quiet', f'{ref}^{{commit}}')
+    except git.GitCommandError:
+        return None
+
+
+def blob_size(repo: git.Repo, blob_id: str) -> int:
+    # Goes through GitPython's `git cat-file --batch-check` process, like read_blob
+    return repo.git.get_object_header(blob_id)[2]
+
+
+def changed_files(repo: git.Repo, base: str, head: str) -> List[Tuple[Optional[Tuple[str, str]], Optional[Tuple[str, str]]]]:
+    # (path, blob id) in base and in head of every file that differs between the two
+    # trees, None on the side a file is missing from or isn't a regular file on.
+    # Renames are paired up so call sites in a moved file don't show up as removed and
+    # added again.
+    output = repo.git.diff_tree('-r', '-z', '-M', '--raw', '--no-abbrev', base, head)
+    fields = iter(output.split('\0'))
+    changes = []
+    for meta in fields:
+        if not meta:
+            continue
+        old_mode, new_mode, old_blob_id, new_blob_id, status = meta.lstrip(':').split()
+        old_path = next(fields)
+        new_path = next(fields) if status[0] in 'RC' else old_path
+        # Skip symlinks and submodules, like list_tree does
+        old = (old_path, old_blob_id) if old_mode in ('100644', '100755') else None
+        new = (new_path, new_blob_id) if new_mode in ('100644', '100755') else None
+        if old or new:
+            changes.append((old, new))
+    return changes
+
+
+def merge_base(repo: git.Repo, base: str, head: str) -> Optional[str]:
+    try:
+        return repo.git.merge_base(base, head)
+    except git.GitCommandError:
+        return None
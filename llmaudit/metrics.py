@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import heapq
+import cProfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+DEFAULT_SLOWEST_FILES = 20
+
+
+class Metrics:
+    # Where a run's time goes. Phase times are summed over every process and thread
+    # they ran in, so with --jobs or parallel clones they can add up to more than the
+    # run's wall time.
+    def __init__(self, slowest_files: int = DEFAULT_SLOWEST_FILES):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.files_scanned = 0
+        self.files_from_cache = 0
+        self.bytes_read = 0
+        self.languages = {}
+        self.libraries = {}
+        self.patterns = {}
+        self.repos = {}
+        self.slowest_files = slowest_files
+        # Min heap of (seconds, file path, bytes), the slowest files seen so far
+        self._slowest = []
+        # Clones are timed from the clone threads
+        self._lock = threading.Lock()
+
+    def add_phase(self, phase: str, seconds: float):
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    @contextmanager
+    def timer(self, phase: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(phase, time.perf_counter() - start)
+
+    def add_file(self, file_path: str, language: str, compact_results: List[Tuple], from_cache: bool,
+                 read_seconds: float, match_seconds: float, bytes_read: int):
+        self.add_phase('read', read_seconds)
+        self.add_phase('match', match_seconds)
+        if from_cache:
+            self.files_from_cache += 1
+        else:
+            self.files_scanned += 1
+        self.bytes_read += bytes_read
+
+        language_stats = self.languages.setdefault(language, {'files': 0, 'match_seconds': 0})
+        language_stats['files'] += 1
+        language_stats['match_seconds'] += match_seconds
+        libraries = set()
+        for _, _, label, _, library in compact_results:
+            libraries.add(library)
+            self.patterns[label] = self.patterns.get(label, 0) + 1
+            self.libraries.setdefault(library, {'files': 0, 'matches': 0})['matches'] += 1
+        for library in libraries:
+            self.libraries[library]['files'] += 1
+
+        entry = (read_seconds + match_seconds, file_path, bytes_read)
+        if len(self._slowest) < self.slowest_files:
+            heapq.heappush(self._slowest, entry)
+        elif self.slowest_files:
+            heapq.heappushpop(self._slowest, entry)
+
+    def add_repo(self, repo: str, **stats):
+        with self._lock:
+            repo_stats = self.repos.setdefault(repo, {})
+            for key, value in stats.items():
+                repo_stats[key] = repo_stats.get(key, 0) + value
+
+    def summary(self) -> Dict:
+        return {
+            'wall_seconds': time.perf_counter() - self.start,
+            'phases': self.phases,
+            'files_scanned': self.files_scanned,
+            'files_from_cache': self.files_from_cache,
+            'bytes_read': self.bytes_read,
+            'languages': self.languages,
+            'libraries': self.libraries,
+            'patterns': dict(sorted(self.patterns.items(), key=lambda item: item[1], reverse=True)),
+            'repos': self.repos,
+            'slowest_files': [{'file_path': file_path, 'seconds': seconds, 'bytes': bytes_read}
+                              for seconds, file_path, bytes_read in sorted(self._slowest, reverse=True)],
+        }
+
+    def write(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        print(f"Metrics written to {path}")
+
+
+@contextmanager
+def profiled(path: str = None):
+    # cProfile dump of the code run inside, for pstats or snakeviz. Only this process is
+    # profiled, so with --jobs the matching done by worker processes isn't included.
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        profiler.dump_stats(path)
+        print(f"Profile written to {path}")
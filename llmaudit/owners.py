@@ -0,0 +1,81 @@
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+from codeowners import MASK, CodeOwners
+
+# Characters that make a CODEOWNERS path a glob rather than a literal
+GLOB_CHARS = set('*?[\\')
+
+
+def _is_literal(text: str) -> bool:
+    return not GLOB_CHARS.intersection(text)
+
+
+class OwnersIndex:
+    # CodeOwners.of() tries every rule's regex in turn, which adds up with thousands of
+    # rules. Here rules are bucketed by what a path must contain for them to match:
+    #  - anchored rules starting with a literal directory ('/src/...', 'docs/api/') by
+    #    that first path component
+    #  - unanchored literal names ('README.md', 'docs/') by the name, which has to be
+    #    one of the path's components
+    #  - unanchored '*.ext' style rules by the text after their last '.', which has to
+    #    be the extension of one of the path's components
+    # Everything else is tried for every path. A lookup only tries the rules in the
+    # path's buckets, in CODEOWNERS precedence order, so the owners are always the ones
+    # CodeOwners.of() returns for the same repo relative path.
+    def __init__(self, codeowners: CodeOwners):
+        # The rules in precedence order, last line of the file first
+        self.rules = [(regex, owners) for regex, _, owners, _, _ in codeowners.paths]
+        self.first_component_rules: Dict[str, List[int]] = {}
+        self.name_rules: Dict[str, List[int]] = {}
+        self.extension_rules: Dict[str, List[int]] = {}
+        self.other_rules: List[int] = []
+        for rule_index, (_, path, _, _, _) in enumerate(codeowners.paths):
+            bucket = self._bucket(path)
+            if bucket is None:
+                self.other_rules.append(rule_index)
+            else:
+                buckets, key = bucket
+                buckets.setdefault(key, []).append(rule_index)
+        self.of = lru_cache(maxsize=4096)(self._of)
+
+    def _bucket(self, path: str):
+        # (bucket, key) for a rule's path, or None if it has to be tried for every path
+        if not path.strip('/'):
+            return None
+        slash_pos = path.find('/')
+        anchored = slash_pos > -1 and slash_pos != len(path) - 1
+        trimmed = path.strip('/')
+        if anchored:
+            first_component = trimmed.split('/', 1)[0]
+            if _is_literal(first_component):
+                return self.first_component_rules, first_component
+            return None
+        if _is_literal(trimmed):
+            return self.name_rules, trimmed
+        if trimmed.startswith('*') and _is_literal(trimmed[1:]) and '.' in trimmed:
+            return self.extension_rules, trimmed.rsplit('.', 1)[1]
+        return None
+
+    def _candidates(self, components: List[str]) -> Iterable[int]:
+        candidates = set(self.other_rules)
+        candidates.update(self.first_component_rules.get(components[0], ()))
+        for component in components:
+            candidates.update(self.name_rules.get(component, ()))
+            if '.' in component:
+                candidates.update(self.extension_rules.get(component.rsplit('.', 1)[1], ()))
+        return sorted(candidates)
+
+    def _of(self, file_path: str) -> List[Tuple[str, str]]:
+        # file_path is relative to the repo root and '/' separated
+        # CodeOwners swaps spaces for a run of slashes before matching, which the
+        # buckets don't account for, so such paths go through every rule
+        if ' ' in file_path:
+            rule_indexes = range(len(self.rules))
+        else:
+            rule_indexes = self._candidates(file_path.split('/'))
+        masked_path = file_path.replace(' ', MASK)
+        for rule_index in rule_indexes:
+            regex, owners = self.rules[rule_index]
+            if regex.search(masked_path) is not None:
+                return owners
+        return []
@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import argparse
+import datetime
+from typing import Dict
+from jinja2 import Environment, FileSystemLoader
+from llmaudit.findings import DEFAULT_RESULTS_DIR, RunStats
+from llmaudit.runs import DEFAULT_RUNS_DIR, MANIFEST_NAME, RunStore, latest_run
+
+# The report's tables are rendered a page at a time in the browser from the run's
+# stats inlined as compact JSON, so the HTML stays small however many repos there are
+REPORT_DATA_NAME = 'report_data.json'
+# Owners listed for each repo, and in the report's summary
+TOP_REPO_OWNERS = 3
+TOP_OWNERS = 10
+
+
+def _by_count(counts: Dict[str, int]) -> Dict[str, int]:
+    return dict(sorted(counts.items(), key=lambda item: item[1], reverse=True))
+
+
+def report_data(stats: RunStats, run_id: str = None) -> Dict:
+    # Repos and owners are rows of arrays rather than objects to keep the JSON small.
+    # A repo's library counts are in the order of 'libraries'.
+    libraries = list(_by_count(stats.library_counts))
+    repos = [[repo, total_usages, [library_counts.get(library, 0) for library in libraries],
+              list(_by_count(owner_counts).items())[:TOP_REPO_OWNERS]]
+             for repo, (total_usages, library_counts, owner_counts) in stats.repos.items()]
+    repos.sort(key=lambda row: row[1], reverse=True)
+    owners = sorted(([owner, usages, repo_count] for owner, (usages, repo_count) in stats.owner_counts.items()),
+                    key=lambda row: row[1], reverse=True)
+    return {
+        'run_id': run_id,
+        'generated': datetime.datetime.now().isoformat(timespec='seconds'),
+        'total_usages': stats.total_usages,
+        'libraries': libraries,
+        'library_counts': [stats.library_counts[library] for library in libraries],
+        'repos': repos,
+        'owners': owners,
+    }
+
+
+def generate_report(stats: RunStats, run_id: str = None, results_dir: str = DEFAULT_RESULTS_DIR) -> str:
+    # Writes the report data JSON and the HTML report to results_dir, returning the report's path
+    data = report_data(stats, run_id)
+    data_json = json.dumps(data, separators=(',', ':'))
+    os.makedirs(results_dir, exist_ok=True)
+    with open(os.path.join(results_dir, REPORT_DATA_NAME), 'w') as f:
+        f.write(data_json)
+
+    env = Environment(loader=FileSystemLoader(os.path.dirname(__file__)))
+    template = env.get_template('report_template.html')
+    # '</' would end the script element the data is inlined in
+    rendered_report = template.render(total_usages=stats.total_usages, total_usage_by_library=_by_count(stats.library_counts),
+                                      top_owners=[(owner, usages) for owner, usages, _ in data['owners'][:TOP_OWNERS]],
+                                      repo_count=len(data['repos']), data_json=data_json.replace('</', '<\\/'))
+
+    current_date = datetime.datetime.now().strftime("%d-%m-%Y")
+    report_name = os.path.join(results_dir, "llm_usage_report_" + current_date + ".html")
+    with open(report_name, 'w') as f:
+        f.write(rendered_report)
+
+    print(f"Success! View your report at: {report_name}")
+    return report_name
+
+
+def add_report_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--run', help=f'Id of the run in {DEFAULT_RUNS_DIR} to report on (default: the latest run)')
+
+
+def run_report_from_args(args: argparse.Namespace) -> int:
+    # Renders the report of a saved run without scanning anything
+    run_dir = os.path.join(DEFAULT_RUNS_DIR, args.run) if args.run else latest_run()
+    if run_dir is None or not os.path.isfile(os.path.join(run_dir, MANIFEST_NAME)):
+        print(f"Error: run {args.run} not found in {DEFAULT_RUNS_DIR}" if args.run else f"Error: no runs found in {DEFAULT_RUNS_DIR}")
+        return 1
+    run = RunStore(run_dir)
+    if not run.manifest['finished']:
+        print(f"Run {run.run_id} is unfinished, reporting on the {len(run.completed)} repos it has scanned so far")
+    generate_report(run.stats, run.run_id)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Render the LLM usage report of a saved run without rescanning.')
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    sys.exit(run_report_from_args(args))
@@ -0,0 +1,166 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import datetime
+from typing import Dict, List, Optional, Tuple
+from llmaudit.findings import DEFAULT_RESULTS_DIR, SINKS, RunStats, close_sinks, open_sinks
+
+DEFAULT_RUNS_DIR = os.path.join(DEFAULT_RESULTS_DIR, 'runs')
+MANIFEST_NAME = 'manifest.json'
+STATS_NAME = 'stats.json'
+
+
+def _write_json_atomic(path: str, data: Dict):
+    # Written next to path and renamed over it, so readers never see half a file
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def _repo_key(repo: str) -> str:
+    # Directory name for a repo: readable, but unique even for repos with the same name
+    name = re.sub(r'[^\w.-]', '_', os.path.basename(os.path.normpath(repo)))[:64]
+    return f"{name}-{hashlib.sha1(os.path.abspath(repo).encode('utf-8')).hexdigest()[:10]}"
+
+
+class RunStore:
+    # One run's results, persisted repo by repo so an interrupted run can be resumed:
+    #   <run dir>/manifest.json                run id, start time, output formats, finished
+    #   <run dir>/repos/<key>/stats.json       repo path, scan order and usage stats
+    #   <run dir>/repos/<key>/results.<format> the repo's findings
+    # A repo's directory is filled under a temporary name and renamed into place when
+    # its scan completes, so every repo is either fully recorded or not at all.
+    def __init__(self, run_dir: str):
+        self.run_dir = run_dir
+        self.repos_dir = os.path.join(run_dir, 'repos')
+        with open(os.path.join(run_dir, MANIFEST_NAME)) as f:
+            self.manifest = json.load(f)
+        self.run_id = self.manifest['run_id']
+        self.output_formats = self.manifest['output_formats']
+        # Repo -> (its directory, its stats.json), for every repo already recorded
+        self.completed = {}
+        for key in os.listdir(self.repos_dir):
+            # .tmp directories are scans in progress, or left behind by interrupted
+            # ones, and are cleared when the repo is scanned again
+            if key.endswith('.tmp'):
+                continue
+            repo_dir = os.path.join(self.repos_dir, key)
+            with open(os.path.join(repo_dir, STATS_NAME)) as f:
+                recorded = json.load(f)
+            self.completed[recorded['repo']] = (repo_dir, recorded)
+        # Kept up to date as repos are recorded, for the report
+        self.stats = RunStats()
+        for _, recorded in self._in_order():
+            if recorded['stats'] is not None:
+                self.stats.add_repo(recorded['repo'], self._stats_tuple(recorded['stats']))
+
+    @classmethod
+    def create(cls, runs_dir: str = DEFAULT_RUNS_DIR, output_formats: List[str] = None) -> 'RunStore':
+        started = datetime.datetime.now()
+        run_id = started.strftime('%Y%m%d-%H%M%S')
+        suffix = 1
+        while True:
+            run_dir = os.path.join(runs_dir, run_id if suffix == 1 else f'{run_id}-{suffix}')
+            try:
+                os.makedirs(run_dir)
+                break
+            except FileExistsError:
+                suffix += 1
+        os.makedirs(os.path.join(run_dir, 'repos'))
+        _write_json_atomic(os.path.join(run_dir, MANIFEST_NAME), {
+            'run_id': os.path.basename(run_dir),
+            'started': started.isoformat(timespec='seconds'),
+            'output_formats': output_formats or ['csv'],
+            'finished': False,
+        })
+        return cls(run_dir)
+
+    def is_done(self, repo: str) -> bool:
+        return repo in self.completed
+
+    def begin_repo(self, repo: str) -> List:
+        # Sinks writing the repo's findings into its temporary directory
+        temp_dir = os.path.join(self.repos_dir, _repo_key(repo) + '.tmp')
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(temp_dir)
+        return open_sinks(self.output_formats, temp_dir)
+
+    def commit_repo(self, repo: str, sinks: List, stats: Optional[Tuple[int, Dict[str, int], Dict[str, int]]]):
+        # stats is None for a repo that couldn't be scanned, which is recorded so a
+        # resumed run doesn't try it again but is left out of the report
+        close_sinks(sinks)
+        key = _repo_key(repo)
+        temp_dir = os.path.join(self.repos_dir, key + '.tmp')
+        recorded = {'repo': repo, 'order': len(self.completed), 'stats': None}
+        if stats is not None:
+            recorded['stats'] = {'total_usages': stats[0], 'library_counts': stats[1], 'owner_counts': stats[2]}
+        _write_json_atomic(os.path.join(temp_dir, STATS_NAME), recorded)
+        repo_dir = os.path.join(self.repos_dir, key)
+        # A repo listed twice in one run is recorded by its last scan
+        shutil.rmtree(repo_dir, ignore_errors=True)
+        os.replace(temp_dir, repo_dir)
+        self.completed[repo] = (repo_dir, recorded)
+        if stats is not None:
+            self.stats.add_repo(repo, stats)
+        else:
+            self.stats.remove_repo(repo)
+
+    def abort_repo(self, repo: str, sinks: List):
+        close_sinks(sinks)
+        shutil.rmtree(os.path.join(self.repos_dir, _repo_key(repo) + '.tmp'), ignore_errors=True)
+
+    def _in_order(self) -> List[Tuple[str, Dict]]:
+        return sorted(self.completed.values(), key=lambda entry: entry[1]['order'])
+
+    @staticmethod
+    def _stats_tuple(stats: Dict) -> Tuple[int, Dict[str, int], Dict[str, int]]:
+        return stats['total_usages'], stats['library_counts'], stats['owner_counts']
+
+    def export(self, results_dir: str = DEFAULT_RESULTS_DIR):
+        # Writes results_dir/results.<format> afresh from every recorded repo, so a
+        # resumed run's results hold each repo exactly once
+        parts = [repo_dir for repo_dir, _ in self._in_order()]
+        for output_format in self.output_formats:
+            sink = SINKS[output_format]
+            sink.merge([os.path.join(repo_dir, sink.file_name) for repo_dir in parts], os.path.join(results_dir, sink.file_name))
+
+    def finish(self):
+        self.manifest['finished'] = True
+        _write_json_atomic(os.path.join(self.run_dir, MANIFEST_NAME), self.manifest)
+
+
+def latest_run(runs_dir: str = DEFAULT_RUNS_DIR, unfinished: bool = False) -> Optional[str]:
+    # The newest run, or newest unfinished run. Run ids start with their start time,
+    # so the newest run sorts last.
+    if not os.path.isdir(runs_dir):
+        return None
+    for run_id in sorted(os.listdir(runs_dir), reverse=True):
+        try:
+            with open(os.path.join(runs_dir, run_id, MANIFEST_NAME)) as f:
+                if not (unfinished and json.load(f)['finished']):
+                    return os.path.join(runs_dir, run_id)
+        except (OSError, ValueError, KeyError):
+            continue
+    return None
+
+
+def open_run(resume: str = None, output_formats: List[str] = None, runs_dir: str = DEFAULT_RUNS_DIR) -> RunStore:
+    # A new run, or with resume (a run id, or 'latest' for the newest unfinished run)
+    # the existing run whose completed repos should be skipped
+    if not resume:
+        return RunStore.create(runs_dir, output_formats)
+    run_dir = latest_run(runs_dir, unfinished=True) if resume == 'latest' else os.path.join(runs_dir, resume)
+    if run_dir is None:
+        print("No unfinished run to resume, starting a new one.")
+        return RunStore.create(runs_dir, output_formats)
+    if not os.path.isfile(os.path.join(run_dir, MANIFEST_NAME)):
+        print(f"Run {resume} not found in {runs_dir}. Exiting...")
+        exit()
+    run = RunStore(run_dir)
+    if output_formats and output_formats != run.output_formats:
+        print(f"Resumed runs keep their original output formats: {', '.join(run.output_formats)}")
+    print(f"Resuming run {run.run_id}, {len(run.completed)} repos already scanned")
+    return run
@@ -1,71 +1,254 @@
 import os
 import shutil
+import time
 import argparse
-from github import Github
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import git
-from llmaudit import sprawl
-from typing import List
+from llmaudit import discovery, sprawl
+from llmaudit.metrics import Metrics, profiled
+from llmaudit.runs import open_run
+from typing import Dict, Iterable, List, Tuple
 
+# git clone options for each clone strategy, cheapest last. The scanner only reads
+# the checked out files, so all of them give the same results.
+CLONE_STRATEGIES = {
+    # Full history
+    'full': {},
+    # Latest commit only
+    'shallow': {'depth': 1},
+    # Full commit history, but only the blobs needed for the checkout are fetched
+    'blobless': {'filter': 'blob:none'},
+    # Latest commit, and only the blobs of files the scanner reads are fetched
+    'sparse': {'depth': 1, 'filter': 'blob:none', 'no_checkout': True},
+}
 
-def scan_repos(folder_name: str, keep_folder: bool, timeout: int, specified_repos: List):
-    # Initialize GitHub client with PyGithub
-    token = os.getenv("GITHUB_TOKEN")
-    if token == None:
-        print("Environment variable GITHUB_TOKEN not found - exiting..")
-        exit()
+
+def _sparse_checkout_patterns() -> List[str]:
+    patterns = ['*' + ext for config in sprawl.LLMUsageScanner.language_configs.values() for ext in config['extensions']]
+    # .gitignore files aren't needed: every file in a fresh clone is tracked, and
+    # .gitignore never applies to tracked files
+    patterns += ['/' + path for path in sprawl.CODEOWNERS_PATHS]
+    return patterns
+
+
+def _clone_repo(name: str, clone_url: str, repo_path: str, timeout: int, strategy: str = 'sparse') -> str:
+    try:
+        print(f"Cloning {name}")
+        repo = git.Repo.clone_from(clone_url, repo_path, kill_after_timeout=timeout, **CLONE_STRATEGIES[strategy])
+        # Empty repos have nothing to check out
+        if strategy == 'sparse' and repo.head.is_valid():
+            # Written to the file directly rather than with `git sparse-checkout`
+            # so it works on older git versions too
+            repo.git.config('core.sparseCheckout', 'true')
+            with open(os.path.join(repo.git_dir, 'info', 'sparse-checkout'), 'w') as f:
+                f.write('\n'.join(_sparse_checkout_patterns()) + '\n')
+            repo.git.checkout(kill_after_timeout=timeout)
+        return repo_path
+    except Exception as e:
+        print("Exception thrown: ", e)
+        print(f"Unable to process repo {name}")
+        # Don't leave a half-cloned repo behind to take up disk space
+        shutil.rmtree(repo_path, ignore_errors=True)
+        return None
+
+
+def _mirror_repo(name: str, clone_url: str, mirror_path: str, timeout: int) -> str:
+    # Mirrors are kept across runs, so after the first run only new objects are fetched
+    try:
+        if os.path.isdir(mirror_path):
+            print(f"Updating mirror of {name}")
+            git.Repo(mirror_path).git.fetch('--prune', 'origin', kill_after_timeout=timeout)
+        else:
+            print(f"Mirroring {name}")
+            git.Repo.clone_from(clone_url, mirror_path, mirror=True, kill_after_timeout=timeout)
+        return mirror_path
+    except Exception as e:
+        print("Exception thrown: ", e)
+        print(f"Unable to process repo {name}")
+        # A failed fetch leaves the existing mirror usable, but a failed first clone doesn't
+        if not os.path.isdir(os.path.join(mirror_path, 'objects')):
+            shutil.rmtree(mirror_path, ignore_errors=True)
+        return None
+
+
+def _is_empty(repo_path: str) -> bool:
+    # Repos without any commits clone fine, but have nothing to scan
+    try:
+        return not git.Repo(repo_path).head.is_valid()
+    except Exception:
+        return False
+
+
+def _timed_clone(metrics: Metrics, clone, *args) -> str:
+    # Runs _clone_repo or _mirror_repo, recording how long it took if metrics are on
+    start = time.perf_counter()
+    repo_path = clone(*args)
+    if metrics is not None and repo_path is not None:
+        seconds = time.perf_counter() - start
+        metrics.add_phase('clone', seconds)
+        metrics.add_repo(repo_path, clone_seconds=seconds)
+    return repo_path
 
 
-    g = Github(token)
+def clone_and_scan(clone_targets: Iterable[Tuple[str, str]], folder_name: str, keep_folder: bool, timeout: int,
+                   jobs: int = 1, clone_workers: int = 4, max_in_flight: int = 8, clone_strategy: str = 'sparse',
+                   cache_path: str = None, cache_max_entries: int = 1000000, walker_options: Dict = None,
+                   output_formats: List[str] = None, mirror_dir: str = None, git_ref: str = 'HEAD',
+                   metrics_path: str = None, resume: str = None):
+    # clone_targets yields (name, clone url) pairs. Up to clone_workers clones run at
+    # once while the main thread scans whichever repo finished cloning first, then
+    # deletes it unless keep_folder is set. No more than max_in_flight repos are ever
+    # cloning or waiting to be scanned, which caps the temp disk usage.
+    # With mirror_dir, repos are instead mirrored into mirror_dir, which is kept across
+    # runs, and git_ref is scanned from each mirror's object database without a checkout.
+    # With resume, repos the resumed run already scanned aren't cloned again.
+    targets = iter(clone_targets)
+    max_in_flight = max(1, max_in_flight)
+    in_flight = set()
+    metrics = Metrics() if metrics_path else None
+    run = open_run(resume, output_formats)
+    scanned_repos = []
+    empty_repos = []
+    executor = sprawl.create_executor(jobs)
+    cache = None
+    try:
+        cache = sprawl.open_cache(cache_path, cache_max_entries)
+        with ThreadPoolExecutor(max_workers=clone_workers) as clone_pool:
+            while True:
+                while len(in_flight) < max_in_flight:
+                    target = next(targets, None)
+                    if target is None:
+                        break
+                    name, clone_url = target
+                    repo_path = os.path.join(mirror_dir, name + '.git') if mirror_dir else os.path.join(folder_name, name)
+                    if run.is_done(repo_path):
+                        continue
+                    if mirror_dir:
+                        in_flight.add(clone_pool.submit(_timed_clone, metrics, _mirror_repo, name, clone_url, repo_path, timeout))
+                    else:
+                        # A resumed run's temp folder can still hold a partial clone
+                        shutil.rmtree(repo_path, ignore_errors=True)
+                        in_flight.add(clone_pool.submit(_timed_clone, metrics, _clone_repo, name, clone_url, repo_path, timeout,
+                                                        clone_strategy))
+                if not in_flight:
+                    break
 
-    # Get the authenticated user
-    user = g.get_user()
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    repo_path = future.result()
+                    if repo_path is None:
+                        continue
+                    # Still scanned, so they're recorded in the run like any other repo
+                    if _is_empty(repo_path):
+                        empty_repos.append(repo_path)
+                    if mirror_dir:
+                        sprawl.scan_repo_to_run(run, repo_path, executor, cache=cache, walker_options=walker_options, git_ref=git_ref,
+                                                metrics=metrics)
+                    else:
+                        # Fresh clones match their index, so cache lookups can skip hashing files
+                        sprawl.scan_repo_to_run(run, repo_path, executor, delete_path=not keep_folder, cache=cache, use_git_index=True,
+                                                walker_options=walker_options, metrics=metrics)
+                    scanned_repos.append(repo_path)
+    finally:
+        sprawl.close_scan_resources(executor, cache)
 
+    # Print the list of repository paths
+    print("Paths of scanned repositories:", scanned_repos)
+    if empty_repos:
+        print(f"Empty repositories, with no commits to scan: {len(empty_repos)}")
+
+    sprawl.finish_run(run, temp_folder_path="" if mirror_dir else folder_name, delete_path=not keep_folder, metrics=metrics,
+                      metrics_path=metrics_path)
+
+
+def scan_repos(folder_name: str, keep_folder: bool, timeout: int, specified_repos: List, jobs: int = 1,
+               clone_workers: int = 4, max_in_flight: int = 8, clone_strategy: str = 'sparse',
+               cache_path: str = None, cache_max_entries: int = 1000000, walker_options: Dict = None,
+               output_formats: List[str] = None, mirror_dir: str = None, git_ref: str = 'HEAD', metrics_path: str = None,
+               profile_path: str = None, resume: str = None, lister_options: Dict = None,
+               api_url: str = discovery.DEFAULT_API_URL):
+    # lister_options are keyword arguments for the RepoLister, see
+    # discovery.lister_options_from_args. Without an org or user the token owner's
+    # repos are scanned.
+    lister_options = lister_options or {}
+    token = os.getenv("GITHUB_TOKEN")
+    if not token:
+        if not (lister_options.get('org') or lister_options.get('user')):
+            print("Environment variable GITHUB_TOKEN not found - exiting..")
+            exit()
+        print("Environment variable GITHUB_TOKEN not found, only public repos will be listed and the API rate limit is low")
+
+    lister = discovery.RepoLister(discovery.GitHubClient(token, api_url), **lister_options)
+
+    if mirror_dir:
+        os.makedirs(mirror_dir, exist_ok=True)
+    # A resumed run carries on in the temp folder the interrupted run created
+    elif resume:
+        os.makedirs(folder_name, exist_ok=True)
     # Ensure the target directory doesn't already exist (don't want to delete existing files)
-    if os.path.exists(folder_name):
+    elif os.path.exists(folder_name):
         print(f"The folder '{folder_name}' already exists. Exiting...")
         exit()
     else:
         os.makedirs(folder_name)
-    # Initialize an empty list to store repository paths
-    cloned_repos = []
-
-    # Loop through all repositories of the authenticated user
-    for repo in user.get_repos():
-        #If a user specified the repos they want to scan, only process those
-        if specified_repos and repo.name not in specified_repos:
-            continue 
-        try:
-            print(f"Cloning {repo.name}")
-            repo_path = os.path.join(folder_name, repo.name)
-            # Use GitPython to clone the repository
-            git.Repo.clone_from(repo.clone_url, repo_path, kill_after_timeout=timeout)
-            # Append the path of the cloned repository to the repos list
-            cloned_repos.append(repo_path)
-        except Exception as e:
-            print("Exception thrown: ", e)
-            print(f"Unable to process repo {repo.name}")
 
-    # Print the list of repository paths
-    print("Paths of cloned repositories:", cloned_repos)
+    # This is a generator so the listing keeps paging in while the first repos are
+    # already being cloned
+    def clone_targets():
+        remaining = set(specified_repos or [])
+        try:
+            for repo in lister.list():
+                #If a user specified the repos they want to scan, only process those
+                if specified_repos:
+                    if repo['name'] not in remaining:
+                        continue
+                    remaining.discard(repo['name'])
+                yield repo['name'], repo['clone_url']
+                if specified_repos and not remaining:
+                    break
+        except discovery.GitHubError as e:
+            print(f"Error listing GitHub repositories, scanning the ones listed so far: {e}")
+        skipped = lister.summary()
+        if skipped:
+            print(f"Repositories not scanned: {skipped}")
+        if remaining:
+            print(f"Repositories not found or filtered out: {', '.join(sorted(remaining))}")
 
-    sprawl.run_llm_usage_scanner(repos=cloned_repos, temp_folder_path=folder_name, delete_path=not keep_folder)
+    with profiled(profile_path):
+        clone_and_scan(clone_targets(), folder_name, keep_folder, timeout, jobs, clone_workers, max_in_flight, clone_strategy,
+                       cache_path, cache_max_entries, walker_options, output_formats, mirror_dir, git_ref, metrics_path, resume)
 
 if __name__ == "__main__":
     # Set up argument parser
-    parser = argparse.ArgumentParser(description='Clone all GitHub repositories for a user into a specified folder using PyGithub and GitPython, with an option to keep or delete the folder afterwards.')
+    parser = argparse.ArgumentParser(description='Clone all GitHub repositories for a user or organization into a specified folder using GitPython, with an option to keep or delete the folder afterwards.')
     parser.add_argument('--repos', nargs='+', help='Names of the repo(s) to scan')
     parser.add_argument('--temp-dir', default='llm_usage_temp', help='Specify the temporary directory to clone repositories into (default: llm_usage_temp)')
     parser.add_argument('--keep', action='store_true', help='Keep the temporary folder after cloning (default: False, will delete)')
     parser.add_argument('--timeout', type=int, default=300, help='Timeout for cloning each repository in seconds (default: 300)')  # Add timeout argument
+    parser.add_argument('--clone-workers', type=int, default=4, help='Number of repositories to clone concurrently (default: 4)')
+    parser.add_argument('--max-in-flight', type=int, default=8, help='Maximum number of repositories cloning or waiting to be scanned at once, which caps temp disk usage (default: 8)')
+    parser.add_argument('--clone-strategy', choices=list(CLONE_STRATEGIES), default='sparse', help='How much of each repository to clone: full history, shallow (latest commit), blobless (no file contents outside the checkout) or sparse (latest commit, scanned files only) (default: sparse)')
+    parser.add_argument('--mirror-dir', help='Keep mirror clones of the repositories in this directory across runs, and scan them without a checkout')
+    parser.add_argument('--ref', help='Branch, tag or commit to scan in each mirror (default: HEAD, the default branch)')
+    discovery.add_discovery_arguments(parser)
+    sprawl.add_scan_arguments(parser)
 
     # Parse arguments
     args = parser.parse_args()
+    if args.ref and not args.mirror_dir:
+        parser.error('--ref requires --mirror-dir')
 
 
     FOLDER_NAME = args.temp_dir
     KEEP_FOLDER = args.keep
     TIMEOUT = args.timeout
     REPOS = args.repos
+    JOBS = args.jobs
+    CLONE_WORKERS = args.clone_workers
+    MAX_IN_FLIGHT = args.max_in_flight
+    CLONE_STRATEGY = args.clone_strategy
 
-    scan_repos(FOLDER_NAME, KEEP_FOLDER, TIMEOUT, REPOS)
-
+    scan_repos(FOLDER_NAME, KEEP_FOLDER, TIMEOUT, REPOS, JOBS, CLONE_WORKERS, MAX_IN_FLIGHT, CLONE_STRATEGY,
+               args.cache, args.cache_max_entries, sprawl.walker_options_from_args(args), args.output_format,
+               args.mirror_dir, args.ref or 'HEAD', args.metrics, args.profile, args.resume,
+               discovery.lister_options_from_args(args), args.api_url)
@@ -1,20 +1,229 @@
 import os
 import re
-import json, csv
+import mmap
+import multiprocessing
+import json
 import argparse
+import git
 from codeowners import CodeOwners
-from typing import Dict, List, Pattern, Tuple
-from jinja2 import Environment, FileSystemLoader
+from typing import Dict, Iterator, List, Optional, Pattern, Tuple
 import shutil
-import datetime
+import time
+from bisect import bisect_left
+from concurrent.futures import Executor, ProcessPoolExecutor
+from itertools import repeat
+from llmaudit.cache import ResultCache, git_blob_id, git_index_blob_ids
+from llmaudit.findings import SINKS, Finding, UsageStats, close_sinks, open_sinks
+from llmaudit.gitobjects import find_in_tree, list_tree, read_blob, resolve_ref
+from llmaudit.metrics import Metrics, profiled
+from llmaudit.owners import OwnersIndex
+from llmaudit.report import generate_report
+from llmaudit.runs import RunStore, open_run
+from llmaudit.walker import DEFAULT_MAX_FILE_SIZE, FileWalker, decode_source, sniff_content
+
+DEFAULT_CACHE_PATH = 'results/scan_cache.sqlite'
+DEFAULT_METRICS_PATH = 'results/metrics.json'
+
+# Files at least this big are memory mapped rather than read, so the ones the import
+# prefilter rejects are never copied into memory
+MMAP_MIN_SIZE = 256 * 1024
+# Files that can't be memory mapped are prefiltered this many bytes at a time
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Where a repo's CODEOWNERS file is looked for, in order of precedence
+CODEOWNERS_PATHS = ['.github/CODEOWNERS', 'docs/CODEOWNERS', '.gitlab/CODEOWNERS', 'CODEOWNERS']
+
+class PatternMatcher:
+    # Compiled form of one language's 'libraries' config. The import patterns of all
+    # libraries are joined into one alternation and the specific patterns into a second
+    # one, so a file is walked once to find which libraries it imports and - only if it
+    # imports any - once more to find every call site.
+    def __init__(self, libraries: Dict):
+        self.library_names = list(libraries)
+        self.libraries = libraries
+        self.import_hints = [patterns['import_hint'].encode('utf-8') for patterns in libraries.values()]
+        self.import_regexes, self.import_matcher = self._compile([patterns['import_pattern'] for patterns in libraries.values()])
+        # Init patterns start with (\w+), which has no literal prefix to skip ahead on,
+        # so they're kept out of the combined matcher and searched per imported library
+        self.init_regexes = [re.compile(patterns['init_pattern']) if patterns.get('init_pattern') else None
+                             for patterns in libraries.values()]
+
+        # specific_keys[i] is the (library index, specific index) of specific alternative i
+        self.specific_keys = []
+        specific_patterns = []
+        for library_index, patterns in enumerate(libraries.values()):
+            for specific_index, specific in enumerate(patterns['specific']):
+                self.specific_keys.append((library_index, specific_index))
+                # The client name prefix is optional in every specific pattern, so it can
+                # move a match's start but never changes which lines match. That lets the
+                # patterns be compiled once with an empty name instead of once per file.
+                specific_patterns.append(specific['pattern'].format(var_name=''))
+        self.specific_regexes, self.specific_matcher = self._compile(specific_patterns)
+
+    def may_import(self, data) -> bool:
+        # Whether the raw bytes (or memory map) of a file could import any library. An
+        # ASCII literal in the decoded text is always in the bytes too, so a file
+        # without any import hint can't match an import pattern and needn't be decoded.
+        return any(data.find(hint) != -1 for hint in self.import_hints)
+
+    @staticmethod
+    def _compile(patterns: List[str]) -> Tuple[List[Pattern], Pattern]:
+        regexes = [re.compile(pattern) for pattern in patterns]
+        # A flat union rather than one named group per pattern: groups stop re from
+        # using the first-character prefilter, which is most of the speed on files
+        # with no matches at all
+        combined = re.compile('|'.join(patterns))
+        return regexes, combined
+
+    @staticmethod
+    def _hits(combined: Pattern, regexes: List[Pattern], content: str):
+        # Yields (pattern index, match) for every position any pattern matches at, in
+        # position order. Searching resumes one character after each hit rather than
+        # after its end so matches of different patterns can overlap, and the union
+        # only says that something matched, so each pattern is re-checked there.
+        pos = 0
+        while True:
+            hit = combined.search(content, pos)
+            if not hit:
+                return
+            start = hit.start()
+            for index, regex in enumerate(regexes):
+                match = regex.match(content, start)
+                if match:
+                    yield index, match
+            pos = start + 1
+
+    def match(self, content: str) -> List[Tuple[str, str, List[Tuple[Dict, List[int]]]]]:
+        # Returns (library, client var name, [(specific, match starts)]) for every imported
+        # library, in config order. The starts are the same non-overlapping matches
+        # re.finditer would find for each specific pattern on its own.
+        imported = set()
+        for index, _ in self._hits(self.import_matcher, self.import_regexes, content):
+            imported.add(index)
+            if len(imported) == len(self.library_names):
+                break
+        if not imported:
+            return []
+
+        var_names = {}
+        for library_index in imported:
+            init_regex = self.init_regexes[library_index]
+            match = init_regex.search(content) if init_regex else None
+            var_names[library_index] = match.group(1) if match else ''
+
+        starts = {}
+        ends = {}
+        for index, match in self._hits(self.specific_matcher, self.specific_regexes, content):
+            key = self.specific_keys[index]
+            if key[0] in imported and match.start() >= ends.get(key, 0):
+                starts.setdefault(key, []).append(match.start())
+                ends[key] = match.end()
+
+        found = []
+        for library_index in sorted(imported):
+            library = self.library_names[library_index]
+            specific_hits = [(specific, starts.get((library_index, specific_index), []))
+                             for specific_index, specific in enumerate(self.libraries[library]['specific'])]
+            found.append((library, var_names[library_index], specific_hits))
+        return found
+
 
 class LLMUsageScanner:
-    #Repo -> stats
-    stats = dict()
-    def __init__(self, root_dir: str, codeowners_path: str = None):
+    # Language -> file extensions and the patterns matched for each library. A library's
+    # import_hint is a literal every match of its import_pattern contains, which files
+    # are checked for before they're decoded.
+    language_configs = {
+        'python': {
+            'extensions': ['.py'],
+            'libraries': {
+                'OpenAI': {
+                    'import_hint': 'openai',
+                    'import_pattern': r'import\s+openai|from\s+openai\s+import\s+\S+',
+                    'init_pattern': r'(\w+)\s*=\s*OpenAI\(\)',
+                    'specific': [
+                        {'pattern': r'({var_name}\.)?chat\.completions\.create\(', 'name': 'OpenAI: Completion Create'},
+                        {'pattern': r'({var_name}\.)?embeddings\.create\(', 'name': 'OpenAI: Embedding Create'},
+                    ]
+                },
+                'Anthropic': {
+                    'import_hint': 'anthropic',
+                    'import_pattern': r'import\s+anthropic|from\s+anthropic\s+import\s+\S+',
+                    'init_pattern': r'(\w+)\s*=\s*anthropic\.Anthropic\(\)',
+                    'specific': [
+                        {'pattern': r'({var_name}\.)?messages\.create\(', 'name': 'Anthropic: Message Create'},
+                        {'pattern': r'({var_name}\.)?messages\.stream\(', 'name': 'Anthropic: Message Stream'},
+                        {'pattern': r'({var_name}\.)?completions\.create\(', 'name': 'Anthropic: Completions Create'},
+                    ]
+                },
+                'Mistral': {
+                    'import_hint': 'mistralai',
+                    'import_pattern': r'import\s+mistralai|from\s+mistralai(\.\S+)?\s+import\s+\S+',
+                    'init_pattern': r'(\w+)\s*=\s*MistralClient\(',
+                    'specific': [
+                        {'pattern': r'({var_name}\.)?chat\(', 'name': 'Mistral: Chat'},
+                        {'pattern': r'({var_name}\.)?chat_stream\(', 'name': 'Mistral: Chat Stream'},
+                        {'pattern': r'({var_name}\.)?embeddings\(', 'name': 'Mistral: Embeddings Create'},
+                    ]
+                }
+            }
+        },
+        'javascript': {
+            'extensions': ['.js', '.jsx', '.ts', '.tsx'],
+            'libraries': {
+                'OpenAI': {
+                    'import_hint': 'openai',
+                    'import_pattern': r'import\s+OpenAI\s+from\s+[\'"]openai[\'"]|const\s+OpenAI\s+=\s+require\([\'"]openai[\'"]\);?',
+                    'init_pattern': r'const\s+(\w+)\s*=\s*new\s+OpenAI\(',
+                    'specific': [
+                        {'pattern': r'({var_name}\.)?chat\.completions\.create\(', 'name': 'OpenAI: Completion Create'},
+                        {'pattern': r'({var_name}\.)?embeddings\.create\(', 'name': 'OpenAI: Embedding Create'},
+                    ]
+                },
+                'Anthropic': {
+                    'import_hint': 'anthropic',
+                    'import_pattern': r'import\s+Anthropic\s+from\s+\'@anthropic-ai/sdk\'|const\s+Anthropic\s+=\s+require\(\'@anthropic-ai/sdk\'\);',
+                    'init_pattern': r'const\s+(\w+)\s*=\s*new\s+Anthropic\(',
+                    'specific': [
+                        {'pattern': r'({var_name}\.)?messages\.create\(', 'name': 'Anthropic: Message Create'},
+                        {'pattern': r'({var_name}\.)?messages\.stream\(', 'name': 'Anthropic: Message Stream'},
+                        {'pattern': r'({var_name}\.)?completions\.create\(', 'name': 'Anthropic: Completions Create'},
+                    ]
+                },
+                'Mistral': {
+                    'import_hint': 'mistralai',
+                    'import_pattern': r'import\s+MistralClient\s+from\s+\'@mistralai/mistralai\'|const\s+MistralClient\s+=\s+require\(\'@mistralai/mistralai\'\);',
+                    'init_pattern': r'const\s+(\w+)\s*=\s*new\s+MistralClient\(',
+                    'specific': [
+                        {'pattern': r'({var_name}\.)?chat\(', 'name': 'Mistral: Chat'},
+                        {'pattern': r'({var_name}\.)?chat_stream\(', 'name': 'Mistral: Chat Stream'},
+                        {'pattern': r'({var_name}\.)?embeddings\(', 'name': 'Mistral: Embeddings Create'},
+                    ]
+                }
+            }
+        }
+    }
+
+    def __init__(self, root_dir: str, codeowners_path: str = None, cache: ResultCache = None, use_git_index: bool = False,
+                 walker_options: Dict = None, git_ref: str = None, metrics: Metrics = None):
         self.root_dir = root_dir
+        self.metrics = metrics
+        self.codeowners_path = codeowners_path
+        self.cache = cache
+        # Keyword arguments for the FileWalker, see walker_options_from_args
+        self.walker_options = walker_options or {}
+        self.walker = None
+        # Take files' blob ids from the git index rather than hashing them, only safe
+        # when the working tree is a clean checkout
+        self.use_git_index = use_git_index
+        # Scan this ref's files from the git object database rather than the working
+        # tree, in which case root_dir can be a bare repo and codeowners_path is a path
+        # in the ref's tree
+        self.git_ref = git_ref
+        self.git_repo = git.Repo(root_dir) if git_ref else None
         codeowners_content = ""
-        if codeowners_path:
+        if codeowners_path and git_ref:
+            codeowners_content = self.git_repo.git.show(f'{git_ref}:{codeowners_path}')
+        elif codeowners_path:
             try:
                 with open(codeowners_path, 'r') as file:
                     codeowners_content = file.read()
@@ -22,307 +231,332 @@ class LLMUsageScanner:
                 print(f"The CODEOWNERS file at {codeowners_path} was not found. Skipping owner matching.")
                 codeowners_content = ""
         self.codeowners_data = CodeOwners(codeowners_content)
-        self.language_configs = {
-            'python': {
-                'extensions': ['.py'],
-                'libraries': {
-                    'OpenAI': {
-                        'import_pattern': r'import\s+openai|from\s+openai\s+import\s+\S+',
-                        'init_pattern': r'(\w+)\s*=\s*OpenAI\(\)',
-                        'specific': [
-                            {'pattern': r'({var_name}\.)?chat\.completions\.create\(', 'name': 'OpenAI: Completion Create'},
-                            {'pattern': r'({var_name}\.)?embeddings\.create\(', 'name': 'OpenAI: Embedding Create'},
-                        ]
-                    },
-                    'Anthropic': {
-                        'import_pattern': r'import\s+anthropic|from\s+anthropic\s+import\s+\S+',
-                        'init_pattern': r'(\w+)\s*=\s*anthropic\.Anthropic\(\)',
-                        'specific': [
-                            {'pattern': r'({var_name}\.)?messages\.create\(', 'name': 'Anthropic: Message Create'},
-                            {'pattern': r'({var_name}\.)?messages\.stream\(', 'name': 'Anthropic: Message Stream'},
-                            {'pattern': r'({var_name}\.)?completions\.create\(', 'name': 'Anthropic: Completions Create'},
-                        ]
-                    },
-                    'Mistral': {
-                        'import_pattern': r'import\s+mistralai|from\s+mistralai(\.\S+)?\s+import\s+\S+',
-                        'init_pattern': r'(\w+)\s*=\s*MistralClient\(',
-                        'specific': [
-                            {'pattern': r'({var_name}\.)?chat\(', 'name': 'Mistral: Chat'},
-                            {'pattern': r'({var_name}\.)?chat_stream\(', 'name': 'Mistral: Chat Stream'},
-                            {'pattern': r'({var_name}\.)?embeddings\(', 'name': 'Mistral: Embeddings Create'},
-                        ]
-                    }
-                }
-            },
-        'javascript': {
-        'extensions': ['.js', '.jsx', '.ts', '.tsx'],
-        'libraries': {
-            'OpenAI': {
-                'import_pattern': r'import\s+OpenAI\s+from\s+[\'"]openai[\'"]|const\s+OpenAI\s+=\s+require\([\'"]openai[\'"]\);?',                'init_pattern': r'const\s+(\w+)\s*=\s*new\s+OpenAI\(',
-                'specific': [
-                {'pattern': r'({var_name}\.)?chat\.completions\.create\(', 'name': 'OpenAI: Completion Create'},
-                {'pattern': r'({var_name}\.)?embeddings\.create\(', 'name': 'OpenAI: Embedding Create'},
-                ]
-            },
-            'Anthropic': {
-                'import_pattern': r'import\s+Anthropic\s+from\s+\'@anthropic-ai/sdk\'|const\s+Anthropic\s+=\s+require\(\'@anthropic-ai/sdk\'\);',
-                'init_pattern': r'const\s+(\w+)\s*=\s*new\s+Anthropic\(',
-                'specific': [
-                    {'pattern': r'({var_name}\.)?messages\.create\(', 'name': 'Anthropic: Message Create'},
-                    {'pattern': r'({var_name}\.)?messages\.stream\(', 'name': 'Anthropic: Message Stream'},
-                    {'pattern': r'({var_name}\.)?completions\.create\(', 'name': 'Anthropic: Completions Create'},
-                ]
-            },
-            'Mistral': {
-                'import_pattern': r'import\s+MistralClient\s+from\s+\'@mistralai/mistralai\'|const\s+MistralClient\s+=\s+require\(\'@mistralai/mistralai\'\);',
-                'init_pattern': r'const\s+(\w+)\s*=\s*new\s+MistralClient\(',
-                'specific': [
-                    {'pattern': r'({var_name}\.)?chat\(', 'name': 'Mistral: Chat'},
-                    {'pattern': r'({var_name}\.)?chat_stream\(', 'name': 'Mistral: Chat Stream'},
-                    {'pattern': r'({var_name}\.)?embeddings\(', 'name': 'Mistral: Embeddings Create'},
-                ]
-            }
-        }
-    }
-        }
-        self.results_by_file = {}
-        self.results = []
-
-    def scan(self):
-        for root, dirs, files in os.walk(self.root_dir):
-            for file in files:
-                for language, config in self.language_configs.items():
-                    if any(file.endswith(ext) for ext in config['extensions']):
-                        file_path = os.path.join(root, file)
-                        self.results_by_file[file_path] = []
-                        self._scan_file(file_path, config['libraries'])
-
-        LLMUsageScanner._write_csv(self.results, 'results/results.csv')
-        LLMUsageScanner.stats[self.root_dir] = self._calc_statistics()
-        
-    
-    def _parse_codeowners(self) -> List[Tuple[str, List[str]]]:
-        codeowners = []
-        with open(self.codeowners_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    parts = line.split()
-                    pattern = parts[0]
-                    owners = parts[1:]
-                    codeowners.append((pattern, owners))
-        return codeowners
-
-
-    def _find_codeowners(self, file_path: str) -> List[str]:
-        codeowners = self.codeowners_data.of(file_path)
-        return codeowners
+        self.owners_index = OwnersIndex(self.codeowners_data)
+        # Compile every language's patterns once so files aren't re-matched per library
+        self.matchers = {language: PatternMatcher(config['libraries']) for language, config in self.language_configs.items()}
+
+    def scan(self, executor: Executor = None, sinks: List = None) -> Tuple[int, Dict[str, int], Dict[str, int]]:
+        # Each file's findings are written to the sinks and counted as soon as the file
+        # is merged, so no more than one file's findings are held at a time. Without
+        # sinks they're appended to the CSV. Returns the repo's (total usages, library
+        # counts, owner counts).
+        own_sinks = sinks is None
+        if own_sinks:
+            sinks = open_sinks(['csv'])
+        usage_stats = UsageStats()
+        start = time.perf_counter()
+        write_seconds = 0
+        try:
+            for finding in self.iter_findings(executor):
+                write_start = time.perf_counter()
+                usage_stats.add(finding)
+                for sink in sinks:
+                    sink.write(finding)
+                write_seconds += time.perf_counter() - write_start
+        finally:
+            if own_sinks:
+                close_sinks(sinks)
+
+        skipped = self.walker.summary()
+        if skipped:
+            print(f"Skipped in {self.root_dir}: {skipped}")
+
+        if self.metrics is not None:
+            self.metrics.add_phase('write', write_seconds)
+            self.metrics.add_repo(self.root_dir, scan_seconds=time.perf_counter() - start, findings=usage_stats.total_results)
+        return usage_stats.as_tuple()
+
+    def iter_findings(self, executor: Executor = None) -> Iterator[Finding]:
+        # Yields every finding in the repo, file by file in walk order
+        start = time.perf_counter()
+        files = list(self._iter_files())
+        if self.cache is not None and self.use_git_index and self.git_ref is None:
+            index = git_index_blob_ids(self.root_dir)
+            files = [(file_path, language, index.get(os.path.relpath(file_path, self.root_dir).replace(os.sep, '/')))
+                     for file_path, language, _ in files]
+        if self.metrics is not None:
+            self.metrics.add_phase('walk', time.perf_counter() - start)
+
+        if executor is None:
+            file_results = (self._match_file_cached(file_path, language, blob_id) for file_path, language, blob_id in files)
+        else:
+            # Workers send back compact per-file results which are merged in walk order,
+            # so the output is the same as a serial scan
+            cache_path = self.cache.path if self.cache is not None else None
+            file_results = executor.map(_scan_file_in_worker, repeat(self.root_dir), repeat(self.codeowners_path), repeat(cache_path),
+                                        [file_path for file_path, _, _ in files], [language for _, language, _ in files],
+                                        [blob_id for _, _, blob_id in files], repeat(self.git_ref), chunksize=32)
+
+        bytes_read = 0
+        for (file_path, language, _), (blob_id, compact_results, skip_reason, from_cache, file_stats) in zip(files, file_results):
+            if self.cache is not None:
+                self.cache.record(blob_id, language, compact_results, skip_reason, from_cache)
+            if skip_reason:
+                self.walker.skipped_files[skip_reason] += 1
+            if self.metrics is not None:
+                self.metrics.add_file(file_path, language, compact_results, from_cache, *file_stats)
+                bytes_read += file_stats[2]
+            yield from self._file_findings(file_path, compact_results)
+        if self.metrics is not None:
+            self.metrics.add_repo(self.root_dir, files=len(files), bytes_read=bytes_read)
+
+    def _iter_files(self):
+        # (file path, language, blob id if it's known) of every file to scan
+        extensions = [ext for config in self.language_configs.values() for ext in config['extensions']]
+        self.walker = FileWalker(self.root_dir, extensions, **self.walker_options)
+        if self.git_ref is not None:
+            entries = list_tree(self.git_repo, self.git_ref)
+            paths = ((os.path.join(self.root_dir, path), blob_id) for path, blob_id in self.walker.walk_tree(entries))
+        else:
+            paths = ((file_path, None) for file_path in self.walker.walk())
+        for file_path, blob_id in paths:
+            for language, config in self.language_configs.items():
+                if any(file_path.endswith(ext) for ext in config['extensions']):
+                    yield file_path, language, blob_id
+
+    def _match_file_cached(self, file_path: str, language: str, blob_id: str = None) -> Tuple[str, List[Tuple], str, bool, Tuple[float, float, int]]:
+        # Returns (blob id, compact results, skip reason, whether they came from the cache,
+        # (seconds reading, seconds matching, bytes read)). The timings are cheap enough to
+        # always take, and are sent back from worker processes with the results.
+        start = time.perf_counter()
+        if self.cache is not None:
+            if blob_id is None:
+                blob_id = git_blob_id(file_path)
+            cached = self.cache.get(blob_id, language)
+            if cached is not None:
+                return (blob_id,) + cached + (True, (time.perf_counter() - start, 0, 0))
+        compact_results, skip_reason, file_stats = self._match_file(file_path, language, blob_id)
+        return blob_id, compact_results, skip_reason, False, file_stats
+
+    def _match_file(self, file_path: str, language: str, blob_id: str = None) -> Tuple[List[Tuple], str, Tuple[float, float, int]]:
+        # Reads and scans one file, bypassing the cache
+        start = time.perf_counter()
+        data, size = self._read_file(file_path, language, blob_id)
+        read_end = time.perf_counter()
+        try:
+            compact_results, skip_reason = self._match_data(data, language)
+            # Pages of a memory map are read as they're matched, so for those most of
+            # the reading is counted as matching
+            return compact_results, skip_reason, (read_end - start, time.perf_counter() - read_end, size)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+    def _read_file(self, file_path: str, language: str, blob_id: str = None) -> Tuple[object, int]:
+        # (the file's bytes, or a read only memory map of them for large files, and the
+        # file's size). Either is only decoded if it passes the import prefilter. The size
+        # is returned separately since a chunked read can return less than the file.
+        if self.git_ref is not None:
+            data = read_blob(self.git_repo, blob_id)
+            return data, len(data)
+        with open(file_path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size < MMAP_MIN_SIZE:
+                data = file.read()
+                return data, len(data)
+            try:
+                return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ), size
+            except (OSError, ValueError):
+                return self._read_chunked(file, language), size
+
+    def _read_chunked(self, file, language: str) -> bytes:
+        # Prefilters a file chunk by chunk and only reads all of it if an import hint
+        # turns up. Otherwise the first chunk is returned, which sniffs the same as the
+        # whole file and, like it, has no import hint, so it's scanned the same.
+        matcher = self.matchers[language]
+        # Chunks overlap by enough that a hint split across two is still found
+        overlap = max(len(hint) for hint in matcher.import_hints) - 1
+        first_chunk = chunk = file.read(READ_CHUNK_SIZE)
+        tail = b''
+        while chunk:
+            window = tail + chunk
+            if matcher.may_import(window):
+                file.seek(0)
+                return file.read()
+            tail = window[-overlap:] if overlap else b''
+            chunk = file.read(READ_CHUNK_SIZE)
+        return first_chunk
+
+    def _match_data(self, data: bytes, language: str) -> Tuple[List[Tuple], str]:
+        # Scans one file's content on its own and returns its results as (line, pattern,
+        # label, exact match, library) tuples that don't depend on where the file is, so
+        # they can be cached by content, along with why the file was skipped if it was
+        self._file_results = []
+        # Lines of this file with an exact match
+        self._exact_lines = set()
+        skip_reason = self._scan_data(data, language)
+        return self._file_results, skip_reason
+
+    def _file_findings(self, file_path: str, compact_results: List[Tuple]) -> Iterator[Finding]:
+        start = time.perf_counter()
+        owners = self._find_codeowners(file_path) if compact_results else ()
+        if self.metrics is not None:
+            self.metrics.add_phase('owners', time.perf_counter() - start)
+        for line, pattern, label, exact_match, library in compact_results:
+            yield Finding(library, file_path, line, pattern, label, owners, exact_match)
+
+
+    def _find_codeowners(self, file_path: str) -> List[Tuple[str, str]]:
+        # CODEOWNERS paths are relative to the repo root
+        return self.owners_index.of(os.path.relpath(file_path, self.root_dir).replace(os.sep, '/'))
     
-    def _scan_file(self, file_path: str, libraries: Dict):
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-
-            for library, patterns in libraries.items():
-                if re.search(patterns['import_pattern'], content):
-                    var_name = self._find_init_client_name(content, patterns.get('init_pattern', ''))
-                    is_exact_match = var_name != ""
-                    updated_specifics = self._update_specific_patterns(patterns['specific'], var_name)
-                    self._scan_for_specific_usage(content, updated_specifics, file_path, library, is_exact_match)
-
-    def _find_init_client_name(self, content: str, init_pattern: str) -> str:
-        match = re.search(init_pattern, content)
-        return match.group(1) if match else ''
-
-    def _update_specific_patterns(self, specifics: List[Dict], var_name: str) -> List[Dict]:
-        return [{'pattern': specific['pattern'].format(var_name=var_name if var_name else ''), 'name': specific['name']} for specific in specifics]
-
-    def _scan_for_specific_usage(self, content: str, specifics: List[Dict], file_path: str, library: str, exact_match: bool):
-        for specific in specifics:
-            self._find_usage(content, specific['pattern'], file_path, library, specific['name'], exact_match)
-
-    def _prev_results_has_conflicting_exact_match(self, line_number: int, file_path: str, curr_match_is_exact: bool) -> bool:
-        index_to_delete = None
-        for index, prev_res in enumerate(self.results_by_file[file_path]):
-            if prev_res['line'] == line_number and prev_res['exact_match']:
-                return True
-            if prev_res['line'] == line_number and not prev_res['exact_match']:
-                # Mark the index for deletion if the current match is an exact match
-                if curr_match_is_exact:
-                    index_to_delete = index
-        
-        # If an index was marked for deletion, remove that item from the list
-        if index_to_delete is not None:
-            del self.results_by_file[file_path][index_to_delete]
-            # After removing, there's no conflicting exact match, so return False
-            return False
-        
-        return False
+    def _scan_data(self, data: bytes, language: str) -> str:
+        # Returns why the file was skipped, or None if it was scanned
+        skip_reason = sniff_content(data)
+        if skip_reason:
+            return skip_reason
+        matcher = self.matchers[language]
+        # Most files mention none of the libraries and are rejected here, undecoded
+        if not matcher.may_import(data):
+            return None
+        content = decode_source(bytes(data))
+
+        found = matcher.match(content)
+        newline_offsets = self._get_newline_offsets(content) if found else []
+        for library, var_name, specific_hits in found:
+            is_exact_match = var_name != ""
+            for specific, starts in specific_hits:
+                pattern = specific['pattern'].format(var_name=var_name)
+                self._find_usage(newline_offsets, starts, pattern, library, specific['name'], is_exact_match)
+        return None
+
+    def _prev_results_has_conflicting_exact_match(self, line_number: int) -> bool:
+        # Any earlier exact match on the same line conflicts
+        return line_number in self._exact_lines
     
-    def _find_usage(self, content: str, pattern: str, file_path: str, library: str, label: str, exact_match: bool) -> bool:
+    def _find_usage(self, newline_offsets: List[int], starts: List[int], pattern: str, library: str, label: str, exact_match: bool) -> bool:
         found = False
-        for match in re.finditer(pattern, content):
+        for start in starts:
             found = True
-            line_number = self._get_line_number(content, match.start())
+            line_number = self._get_line_number(newline_offsets, start)
             
-            owners = ()
-            if self.codeowners_data != "":
-                owners = self._find_codeowners(file_path)
             #Check if the same line has been found before in this file with an exact match
-            has_conflicting_match = self._prev_results_has_conflicting_exact_match(line_number, file_path, exact_match)
+            has_conflicting_match = self._prev_results_has_conflicting_exact_match(line_number)
 
             #If there is a conflicting result on the same line and the current match is not an exact match
             if has_conflicting_match and not exact_match:
                 return False
 
-            result = {
-                'line': line_number,
-                'pattern': pattern,
-                'label': label,
-                'owners': owners,
-                'exact_match': exact_match,
-                'file_path': file_path,
-                'library': library
-            }
-            self.results_by_file[file_path].append(result)
-            self.results.append(result)
+            # File path and owners are added once per file when the results are merged
+            self._file_results.append((line_number, pattern, label, exact_match, library))
+            if exact_match:
+                self._exact_lines.add(line_number)
 
         return found
-    
-    def _calc_statistics(self):
-        library_counts = {}
-        owner_counts = {}  # Use a dict to count occurrences of each owner
-        total_results = len(self.results)
-
-        for result in self.results:
-            library = result['library']
-            if library in library_counts:
-                library_counts[library] += 1
-            else:
-                library_counts[library] = 1
-            
-            # Aggregate owners
-            owners = result.get('owners', [])
-            for owner in owners:
-                if isinstance(owner, tuple):
-                    owner = ', '.join(owner)  # Convert tuple to string if necessary
-                if owner in owner_counts:
-                    owner_counts[owner] += 1
-                else:
-                    owner_counts[owner] = 1
-        
-        # Optionally, return the statistics if you need to use them elsewhere
-        return total_results, library_counts, owner_counts
-
 
     @staticmethod
-    def _get_line_number(content: str, char_index: int) -> int:
-        return content.count('\n', 0, char_index) + 1
+    def _get_newline_offsets(content: str) -> List[int]:
+        return [match.start() for match in re.finditer('\n', content)]
 
     @staticmethod
-    def _write_csv(data: Dict, file_name: str):
-        os.makedirs(os.path.dirname(file_name), exist_ok=True)
-        file_exists = os.path.isfile(file_name)
-        with open(file_name, mode='a' if file_exists else 'w', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            # Write the header only if the file does not exist
-            if not file_exists:
-                writer.writerow(['Library', 'File Path', 'Line Number', 'Pattern', 'Label', 'Owners', 'Exact Match', 'Secured?'])
-            for result in data:
-                writer.writerow([
-                    result['library'],
-                    result['file_path'],
-                    result['line'],
-                    result['pattern'],
-                    result['label'],
-                    result['owners'],  # Assuming owners is a list
-                    result['exact_match']
-                ])
-
-    @staticmethod
-    def _aggregate_usage():
-        total_usage_by_library = {}
-        total_usages = 0
-        owner_usage = {}
-
-        for _, repo_stats in LLMUsageScanner.stats.items():
-            total_usages += repo_stats[0]  # Total usages for the repo
-            library_counts = repo_stats[1]  # Library counts
-            for library, count in library_counts.items():
-                total_usage_by_library[library] = total_usage_by_library.get(library, 0) + count
-
-            owner_info = repo_stats[2]  # Set of owners
-            for owner, usage_count in owner_info.items():
-                if owner in owner_usage:
-                    owner_usage[owner] += usage_count
-                else:
-                    owner_usage[owner] = usage_count
-
-        # Identifying top owners based on the number of occurrences across repos
-        top_owners = sorted(owner_usage.items(), key=lambda x: x[1], reverse=True)
-
-        return {"total_usage_by_library": total_usage_by_library, "total_usages": total_usages, "top_owners": top_owners}
-    
-    @staticmethod
-    def generate_report():
-        template_dir = os.path.dirname(__file__)
-        env = Environment(loader=FileSystemLoader(template_dir))
-        template = env.get_template('report_template.html')
-
-        aggregate_stats = LLMUsageScanner._aggregate_usage()
-        repo_stats = {repo_name: {"total_usages": stats[0], 
-                                  "library_counts": stats[1], 
-                                  "owner_counts": dict(sorted(stats[2].items(), key=lambda item: item[1], reverse=True)[:3])}
-                      for repo_name, stats in LLMUsageScanner.stats.items()}
-
-        # Render the template with data
-        rendered_report = template.render(**aggregate_stats, repo_stats=repo_stats)
-
-        # Save the rendered HTML to a file
-        current_date = datetime.datetime.now().strftime("%d-%m-%Y")
-        report_name = "results/llm_usage_report_" + current_date + ".html"
-        with open(report_name, 'w') as f:
-            f.write(rendered_report)
-
-        print(f"Success! View your report at: {report_name}")
-        print("You can also find a CSV of all the results in the same directory!")
-
-
-
-def run_llm_usage_scanner(repos : List, temp_folder_path="", delete_path: bool = False):
-    codeowners_paths = ['.github/CODEOWNERS', 'docs/CODEOWNERS', '.gitlab/CODEOWNERS', 'CODEOWNERS']
-        
-    for repo in repos:
-        if not os.path.isdir(repo):
-            print(f"Error: The repository path {repo} does not exist. Skipping...")
-            continue
-
-        codeowners_path_found = None
-        for potential_path in codeowners_paths:
+    def _get_line_number(newline_offsets: List[int], char_index: int) -> int:
+        # Number of newlines before char_index, plus one
+        return bisect_left(newline_offsets, char_index) + 1
+
+
+# Per worker process scanner, rebuilt whenever the worker moves on to another repo,
+# and read only handle on the result cache (the parent process records the results)
+_worker_scanner = None
+_worker_cache = None
+
+def _scan_file_in_worker(root_dir: str, codeowners_path: str, cache_path: str, file_path: str, language: str,
+                         blob_id: str = None, git_ref: str = None) -> Tuple[str, List[Tuple], str, bool, Tuple[float, float, int]]:
+    global _worker_scanner, _worker_cache
+    if cache_path is not None and (_worker_cache is None or _worker_cache.path != cache_path):
+        _worker_cache = ResultCache(cache_path, LLMUsageScanner.language_configs, read_only=True)
+    cache = _worker_cache if cache_path is not None else None
+    if _worker_scanner is None or (_worker_scanner.root_dir, _worker_scanner.codeowners_path, _worker_scanner.cache, _worker_scanner.git_ref) != (root_dir, codeowners_path, cache, git_ref):
+        _worker_scanner = LLMUsageScanner(root_dir=root_dir, codeowners_path=codeowners_path, cache=cache, git_ref=git_ref)
+    return _worker_scanner._match_file_cached(file_path, language, blob_id)
+
+
+def create_executor(jobs: int = 1) -> Executor:
+    # One pool shared by every repo in a run; jobs=0 uses all cores. The pool starts its
+    # workers lazily, by which time scan_github_repos has clone threads running, and
+    # forking a process with other threads can deadlock the child on a lock one of them
+    # held, so workers are started from a fork server (or spawned where there's none).
+    if jobs == 1:
+        return None
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=jobs or os.cpu_count(), mp_context=multiprocessing.get_context(start_method))
+
+
+def scan_repo(repo: str, executor: Executor = None, delete_path: bool = False, cache: ResultCache = None,
+              use_git_index: bool = False, walker_options: Dict = None, sinks: List = None, git_ref: str = None,
+              metrics: Metrics = None) -> Optional[Tuple[int, Dict[str, int], Dict[str, int]]]:
+    # With git_ref, the ref's files are scanned from the git object database of repo
+    # rather than its working tree. Returns the repo's stats, or None if it was skipped.
+    if not os.path.isdir(repo):
+        print(f"Error: The repository path {repo} does not exist. Skipping...")
+        return None
+
+    codeowners_path_found = None
+    if git_ref is not None:
+        try:
+            git_repo = git.Repo(repo)
+        except git.InvalidGitRepositoryError:
+            print(f"Error: {repo} is not a git repository. Skipping...")
+            return None
+        if resolve_ref(git_repo, git_ref) is None:
+            print(f"Error: {git_ref} is not a commit in {repo}. Skipping...")
+            return None
+        codeowners_path_found = find_in_tree(git_repo, git_ref, CODEOWNERS_PATHS)
+    else:
+        for potential_path in CODEOWNERS_PATHS:
             full_path = os.path.join(repo, potential_path)
             if os.path.exists(full_path):
                 codeowners_path_found = full_path
                 break
-        if codeowners_path_found:
-            scanner = LLMUsageScanner(root_dir=repo, codeowners_path=codeowners_path_found)
-        else:
-            print(f"No CODEOWNERS file found in {repo}. Proceeding without CODEOWNERS.")
-            scanner = LLMUsageScanner(root_dir=repo)
-        
+    if codeowners_path_found:
+        scanner = LLMUsageScanner(root_dir=repo, codeowners_path=codeowners_path_found, cache=cache, use_git_index=use_git_index,
+                                  walker_options=walker_options, git_ref=git_ref, metrics=metrics)
+    else:
+        print(f"No CODEOWNERS file found in {repo}. Proceeding without CODEOWNERS.")
+        scanner = LLMUsageScanner(root_dir=repo, cache=cache, use_git_index=use_git_index, walker_options=walker_options,
+                                  git_ref=git_ref, metrics=metrics)
+    
 
 
-        #Run the scan
-        scanner.scan()
-        
-        # Delete the repo if specified
-        if delete_path:
-            try:
-                shutil.rmtree(repo)
-                print(f"Deleted repository: {repo}")
-            except Exception as e:
-                print(f"Error deleting repository {repo}: {e}")
+    #Run the scan
+    stats = scanner.scan(executor, sinks)
+    
+    # Delete the repo if specified
+    if delete_path:
+        try:
+            shutil.rmtree(repo)
+            print(f"Deleted repository: {repo}")
+        except Exception as e:
+            print(f"Error deleting repository {repo}: {e}")
+    return stats
+
+
+def scan_repo_to_run(run: RunStore, repo: str, *args, **kwargs):
+    # scan_repo, with the repo's findings and stats recorded in the run once the scan
+    # has completed. A scan that fails or is interrupted leaves nothing behind, so a
+    # resumed run scans the repo again.
+    sinks = run.begin_repo(repo)
+    try:
+        stats = scan_repo(repo, *args, sinks=sinks, **kwargs)
+    except BaseException:
+        run.abort_repo(repo, sinks)
+        raise
+    run.commit_repo(repo, sinks, stats)
+
+
+def finish_run(run: RunStore, temp_folder_path="", delete_path: bool = False, metrics: Metrics = None, metrics_path: str = None):
+    # The results files and report cover every repo recorded in the run, including
+    # ones scanned before it was resumed
+    start = time.perf_counter()
+    run.export()
+    if metrics is not None:
+        metrics.add_phase('write', time.perf_counter() - start)
 
     #Generate a report
-    LLMUsageScanner.generate_report()
+    start = time.perf_counter()
+    generate_report(run.stats, run.run_id)
+    print("You can also find a CSV of all the results in the same directory!")
+    if metrics is not None:
+        metrics.add_phase('report', time.perf_counter() - start)
     
     # Delete the temporary folder after generating the report, if delete_path is True
     if delete_path and temp_folder_path:
@@ -332,11 +566,87 @@ def run_llm_usage_scanner(repos : List, temp_folder_path="", delete_path: bool =
         except Exception as e:
             print(f"Error deleting temporary folder {temp_folder_path}: {e}")
 
+    run.finish()
+    if metrics is not None:
+        metrics.write(metrics_path)
+
+
+def close_scan_resources(executor: Executor, cache: ResultCache):
+    # Also called when a scan fails or is interrupted, so the worker processes are
+    # stopped and the results cached so far are written
+    if executor is not None:
+        executor.shutdown()
+    if cache is not None:
+        cache.close()
+
+
+def open_cache(cache_path: str = None, cache_max_entries: int = 1000000) -> ResultCache:
+    if not cache_path:
+        return None
+    return ResultCache(cache_path, LLMUsageScanner.language_configs, max_entries=cache_max_entries)
+
+
+def add_scan_arguments(parser: argparse.ArgumentParser):
+    # Options shared by every command that scans repos
+    parser.add_argument('--jobs', type=int, default=1, help='Number of processes to scan files with, 0 for one per core (default: 1)')
+    parser.add_argument('--cache', nargs='?', const=DEFAULT_CACHE_PATH, help=f'Reuse results for files whose content is unchanged since a previous run, stored in the given file (default: {DEFAULT_CACHE_PATH})')
+    parser.add_argument('--cache-max-entries', type=int, default=1000000, help='Maximum number of files kept in the cache, least recently used ones are evicted first (default: 1000000)')
+    parser.add_argument('--output-format', nargs='+', choices=list(SINKS), default=['csv'], help='Formats to write the results in, to results/results.<format> (default: csv)')
+    parser.add_argument('--metrics', nargs='?', const=DEFAULT_METRICS_PATH, help=f'Write where the run spent its time, per phase, language, library, pattern, repo and slowest file, as JSON to the given file (default: {DEFAULT_METRICS_PATH})')
+    parser.add_argument('--profile', help='Write a cProfile dump of the run to this file. With --jobs, matching in worker processes is not included.')
+    parser.add_argument('--resume', nargs='?', const='latest', help='Resume an interrupted run, skipping the repos it already scanned: the given run id from results/runs, or the latest unfinished run')
+    add_walker_arguments(parser)
+
+
+def add_walker_arguments(parser: argparse.ArgumentParser):
+    # Options for which files are scanned, see walker_options_from_args
+    parser.add_argument('--include', nargs='+', help='Only scan files matching these gitignore style patterns')
+    parser.add_argument('--exclude', nargs='+', help='Skip files and directories matching these gitignore style patterns')
+    parser.add_argument('--max-file-size', type=int, default=DEFAULT_MAX_FILE_SIZE, help=f'Skip files larger than this many bytes, 0 for no limit (default: {DEFAULT_MAX_FILE_SIZE})')
+    parser.add_argument('--no-gitignore', action='store_true', help='Scan untracked files ignored by .gitignore too (tracked files are always scanned)')
+    parser.add_argument('--no-default-excludes', action='store_true', help='Scan dependency, build and virtualenv directories like node_modules, dist and .venv too')
+
+
+def walker_options_from_args(args: argparse.Namespace) -> Dict:
+    return {
+        'include': args.include,
+        'exclude': args.exclude,
+        'max_file_size': args.max_file_size,
+        'use_gitignore': not args.no_gitignore,
+        'use_default_excludes': not args.no_default_excludes,
+    }
+
+
+def run_llm_usage_scanner(repos : List, temp_folder_path="", delete_path: bool = False, jobs: int = 1,
+                          cache_path: str = None, cache_max_entries: int = 1000000, walker_options: Dict = None,
+                          output_formats: List[str] = None, git_ref: str = None, metrics_path: str = None,
+                          profile_path: str = None, resume: str = None):
+    with profiled(profile_path):
+        metrics = Metrics() if metrics_path else None
+        run = open_run(resume, output_formats)
+        executor = create_executor(jobs)
+        cache = None
+        try:
+            cache = open_cache(cache_path, cache_max_entries)
+            for repo in repos:
+                if run.is_done(repo):
+                    continue
+                scan_repo_to_run(run, repo, executor, delete_path, cache, walker_options=walker_options, git_ref=git_ref,
+                                 metrics=metrics)
+        finally:
+            close_scan_resources(executor, cache)
+
+        finish_run(run, temp_folder_path, delete_path, metrics, metrics_path)
+
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Scan for LLM library usage and check CODEOWNERS.')
     parser.add_argument('repos', nargs='+', help='Root directory of the repo(s) to scan')
+    parser.add_argument('--ref', help='Scan this branch, tag or commit straight from the git object database instead of the working tree, the repos can be bare clones')
+    add_scan_arguments(parser)
     args = parser.parse_args()
 
-    run_llm_usage_scanner(args.repos)
\ No newline at end of file
+    run_llm_usage_scanner(args.repos, jobs=args.jobs, cache_path=args.cache, cache_max_entries=args.cache_max_entries,
+                          walker_options=walker_options_from_args(args), output_formats=args.output_format, git_ref=args.ref,
+                          metrics_path=args.metrics, profile_path=args.profile, resume=args.resume)
\ No newline at end of file
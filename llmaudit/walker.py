@@ -0,0 +1,231 @@
+import os
+import re
+import git
+from collections import Counter
+from codeowners import path_to_regex
+from typing import Dict, Iterable, Iterator, List, Optional, Pattern, Set, Tuple
+
+# gitignore style patterns skipped unless use_default_excludes is turned off:
+# dependencies, build output and virtualenvs, which are almost never first party code
+DEFAULT_EXCLUDES = [
+    '.git/', '.hg/', '.svn/',
+    'node_modules/', 'bower_components/', 'jspm_packages/', 'vendor/', 'third_party/',
+    'dist/', 'build/', 'out/', '.next/', '.nuxt/', 'coverage/',
+    '.venv/', 'venv/', 'site-packages/', '__pycache__/', '.tox/', '.nox/', '.mypy_cache/', '.pytest_cache/',
+    '*.min.js', '*.bundle.js',
+]
+
+DEFAULT_MAX_FILE_SIZE = 1024 * 1024
+
+# Content sniffing only looks at the start of a file
+SNIFF_BYTES = 8192
+# Lines this long on average are minified or generated, not hand written code
+MINIFIED_AVERAGE_LINE_LENGTH = 500
+
+
+def sniff_content(data: bytes) -> Optional[str]:
+    # Returns why the file shouldn't be scanned, or None if it should
+    sample = data[:SNIFF_BYTES]
+    if b'\0' in sample:
+        return 'binary'
+    if len(sample) >= SNIFF_BYTES // 2 and len(sample) / (sample.count(b'\n') + 1) > MINIFIED_AVERAGE_LINE_LENGTH:
+        return 'minified'
+    return None
+
+
+def decode_source(data: bytes) -> str:
+    # Same text open(..., 'r') would give, newlines included, except that bytes that
+    # aren't valid UTF-8 are replaced rather than raising
+    return data.decode('utf-8', errors='replace').replace('\r\n', '\n').replace('\r', '\n')
+
+
+def compile_patterns(patterns: Iterable[str]) -> List[Tuple[Pattern, bool, bool]]:
+    # gitignore style patterns -> (regex, negated, directories only). The regexes are
+    # the ones the codeowners package builds, which follow the same rules as
+    # .gitignore, but only match a whole path: git never applies a pattern matching a
+    # directory to the files inside it, it just doesn't descend into the directory.
+    # Paths are matched without a trailing slash, since '*' can match nothing and
+    # 'dir/*' would match 'dir/' itself.
+    compiled = []
+    for pattern in patterns:
+        pattern = pattern.rstrip()
+        if not pattern or pattern.startswith('#'):
+            continue
+        negated = pattern.startswith('!')
+        if negated:
+            pattern = pattern[1:]
+        if pattern.startswith('\\'):
+            pattern = pattern[1:]
+        if pattern.rstrip('/'):
+            regex = re.compile(path_to_regex(pattern.rstrip('/')).pattern + r'\Z')
+            compiled.append((regex, negated, pattern.endswith('/')))
+    return compiled
+
+
+def matches(patterns: List[Tuple[Pattern, bool, bool]], rel_path: str, is_dir: bool = False) -> Optional[bool]:
+    # The last pattern matching rel_path decides; None if none match
+    for regex, negated, dirs_only in reversed(patterns):
+        if (is_dir or not dirs_only) and regex.search(rel_path):
+            return not negated
+    return None
+
+
+def matches_path_or_parent(patterns: List[Tuple[Pattern, bool, bool]], rel_path: str) -> Optional[bool]:
+    # Like matches() for a file, falling back to its innermost parent directory a
+    # pattern matches, so 'src/' matches every file under src
+    parts = rel_path.split('/')
+    for depth in range(len(parts), 0, -1):
+        matched = matches(patterns, '/'.join(parts[:depth]), is_dir=depth < len(parts))
+        if matched is not None:
+            return matched
+    return None
+
+
+def tracked_paths(root_dir: str) -> Set[str]:
+    # Paths relative to root_dir, '/' separated, of the files under it in its git
+    # repo's index. Empty if root_dir isn't in a git repo.
+    try:
+        output = git.Git(root_dir).ls_files('-z')
+    except (git.GitCommandError, OSError):
+        return set()
+    return {path for path in output.split('\0') if path}
+
+
+class FileWalker:
+    # os.walk over a repo that prunes excluded directories before descending into them
+    # and skips files by extension, exclude/include patterns, .gitignore and size.
+    # Like git, .gitignore only skips untracked files: a tracked file is scanned, and
+    # an ignored directory holding tracked files is walked for them.
+    # Every pruned directory and skipped file is counted by reason.
+    def __init__(self, root_dir: str, extensions: Iterable[str], include: List[str] = None, exclude: List[str] = None,
+                 max_file_size: int = DEFAULT_MAX_FILE_SIZE, use_gitignore: bool = True, use_default_excludes: bool = True):
+        self.root_dir = root_dir
+        self.extensions = tuple(extensions)
+        self.default_excludes = compile_patterns(DEFAULT_EXCLUDES if use_default_excludes else [])
+        self.excludes = compile_patterns(exclude or [])
+        self.includes = compile_patterns(include or [])
+        self.max_file_size = max_file_size
+        self.use_gitignore = use_gitignore
+        self.pruned_dirs = Counter()
+        self.skipped_files = Counter()
+
+    def _load_gitignore(self, dir_path: str) -> List[Tuple[Pattern, bool, bool]]:
+        patterns = []
+        ignore_files = [os.path.join(dir_path, '.gitignore')]
+        if dir_path == self.root_dir:
+            ignore_files.append(os.path.join(dir_path, '.git', 'info', 'exclude'))
+        for ignore_file in ignore_files:
+            try:
+                with open(ignore_file, 'r', encoding='utf-8', errors='replace') as file:
+                    patterns += compile_patterns(file.read().splitlines())
+            except OSError:
+                pass
+        return patterns
+
+    def _excluded(self, rel_path: str, gitignores: List[Tuple[str, List]], is_dir: bool = False) -> Optional[str]:
+        # Why rel_path (relative to root_dir, '/' separated, without a trailing slash)
+        # is excluded, or None
+        if matches(self.default_excludes, rel_path, is_dir):
+            return 'default excludes'
+        if matches(self.excludes, rel_path, is_dir):
+            return 'exclude patterns'
+        # Deeper .gitignore files take precedence, each matched relative to its directory
+        for base, patterns in reversed(gitignores):
+            ignored = matches(patterns, rel_path[len(base):], is_dir)
+            if ignored is not None:
+                return 'gitignore' if ignored else None
+        return None
+
+    def walk(self) -> Iterator[str]:
+        # (directory relative to root_dir with a trailing '/', its .gitignore patterns)
+        gitignore_stack = []
+        tracked = tracked_paths(self.root_dir) if self.use_gitignore else set()
+        tracked_dirs = {path[:index] for path in tracked for index, char in enumerate(path) if char == '/'}
+        # Ignored directories walked for their tracked files, with a trailing '/'
+        ignored_dirs = set()
+        for root, dirs, files in os.walk(self.root_dir):
+            rel_root = os.path.relpath(root, self.root_dir).replace(os.sep, '/') + '/'
+            if rel_root == './':
+                rel_root = ''
+            if self.use_gitignore:
+                while gitignore_stack and not rel_root.startswith(gitignore_stack[-1][0]):
+                    gitignore_stack.pop()
+                patterns = self._load_gitignore(root)
+                if patterns:
+                    gitignore_stack.append((rel_root, patterns))
+            # Everything in an ignored directory is ignored too
+            in_ignored_dir = rel_root in ignored_dirs
+
+            # Pruning dirs in place stops os.walk from descending into them
+            kept_dirs = []
+            for dir_name in dirs:
+                rel_dir = rel_root + dir_name
+                reason = self._excluded(rel_dir, gitignore_stack, is_dir=True)
+                if in_ignored_dir and not reason:
+                    reason = 'gitignore'
+                if reason == 'gitignore' and rel_dir in tracked_dirs:
+                    ignored_dirs.add(rel_dir + '/')
+                    reason = None
+                if reason:
+                    self.pruned_dirs[reason] += 1
+                else:
+                    kept_dirs.append(dir_name)
+            dirs[:] = kept_dirs
+
+            for file in files:
+                if not file.endswith(self.extensions):
+                    continue
+                rel_path = rel_root + file
+                reason = self._excluded(rel_path, gitignore_stack)
+                if in_ignored_dir and not reason:
+                    reason = 'gitignore'
+                if reason == 'gitignore' and rel_path in tracked:
+                    reason = None
+                if not reason and self.includes and not matches_path_or_parent(self.includes, rel_path):
+                    reason = 'not included'
+                file_path = os.path.join(root, file)
+                if not reason and self.max_file_size:
+                    try:
+                        if os.path.getsize(file_path) > self.max_file_size:
+                            reason = 'too large'
+                    except OSError:
+                        reason = 'unreadable'
+                if reason:
+                    self.skipped_files[reason] += 1
+                    continue
+                yield file_path
+
+    def walk_tree(self, entries: List[Tuple[str, str, int]]) -> Iterator[Tuple[str, str]]:
+        # Same as walk(), over the (path, blob id, size) entries of a git tree rather than
+        # a directory, yielding (path, blob id). Every file in a tree is committed, and
+        # git never ignores committed files, so .gitignore files don't apply here.
+        # Directory -> whether it's pruned, each checked once like os.walk does
+        pruned = {}
+        for path, blob_id, size in entries:
+            parts = path.split('/')
+            if any(self._dir_pruned('/'.join(parts[:depth]), pruned) for depth in range(1, len(parts))):
+                continue
+            if not path.endswith(self.extensions):
+                continue
+            reason = self._excluded(path, [])
+            if not reason and self.includes and not matches_path_or_parent(self.includes, path):
+                reason = 'not included'
+            if not reason and self.max_file_size and size > self.max_file_size:
+                reason = 'too large'
+            if reason:
+                self.skipped_files[reason] += 1
+                continue
+            yield path, blob_id
+
+    def _dir_pruned(self, dir_path: str, pruned: Dict[str, bool]) -> bool:
+        if dir_path not in pruned:
+            reason = self._excluded(dir_path, [], is_dir=True)
+            if reason:
+                self.pruned_dirs[reason] += 1
+            pruned[dir_path] = bool(reason)
+        return pruned[dir_path]
+
+    def summary(self) -> str:
+        parts = [f"{count} dirs ({reason})" for reason, count in self.pruned_dirs.most_common()]
+        parts += [f"{count} files ({reason})" for reason, count in self.skipped_files.most_common()]
+        return ', '.join(parts)
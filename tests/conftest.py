@@ -0,0 +1,37 @@
+import os
+import subprocess
+import pytest
+
+OPENAI_SOURCE = 'from openai import OpenAI\nclient = OpenAI()\nclient.chat.completions.create(model="gpt-4o")\n'
+
+
+def _git(repo_path: str, *args: str) -> str:
+    return subprocess.run(['git', '-C', repo_path, *args], check=True, capture_output=True, text=True).stdout
+
+
+@pytest.fixture
+def make_git_repo(monkeypatch):
+    # Creates a git repo at path with files (path -> content) committed, returning its
+    # path. Files listed in untracked are written but left out of the commit.
+    for name in ('AUTHOR', 'COMMITTER'):
+        monkeypatch.setenv(f'GIT_{name}_NAME', 'Test')
+        monkeypatch.setenv(f'GIT_{name}_EMAIL', 'test@example.com')
+
+    def make(path: str, files: dict, untracked: dict = None, bare: bool = False) -> str:
+        work_path = path + '.work' if bare else path
+        os.makedirs(work_path)
+        _git(work_path, 'init', '-q')
+        for file_path, content in {**files, **(untracked or {})}.items():
+            full_path = os.path.join(work_path, file_path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, 'w') as f:
+                f.write(content)
+        if files:
+            # -f so files matched by a committed .gitignore are tracked anyway
+            _git(work_path, 'add', '-f', *files)
+            _git(work_path, 'commit', '-q', '-m', 'files')
+        if bare:
+            subprocess.run(['git', 'clone', '-q', '--bare', work_path, path], check=True, capture_output=True)
+        return path
+
+    return make
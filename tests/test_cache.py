@@ -0,0 +1,122 @@
+import copy
+import sqlite3
+import pytest
+from llmaudit import cache as cache_module, sprawl
+from llmaudit.cache import ResultCache
+from llmaudit.sprawl import LLMUsageScanner, create_executor, scan_repo
+from conftest import OPENAI_SOURCE
+
+CONFIGS = LLMUsageScanner.language_configs
+RESULTS = [(3, 'pattern', 'OpenAI: Completion Create', True, 'OpenAI')]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # last_used times come from a clock the test moves forward
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, 'time', lambda: now[0])
+    return now
+
+
+def _cached_blob_ids(path: str):
+    connection = sqlite3.connect(path)
+    try:
+        return sorted(row[0] for row in connection.execute('SELECT blob_id FROM results'))
+    finally:
+        connection.close()
+
+
+def test_changed_patterns_drop_cached_results(tmp_path, capsys):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = ResultCache(path, CONFIGS)
+    cache.record('blob1', 'python', RESULTS, None, from_cache=False)
+    cache.close()
+
+    cache = ResultCache(path, CONFIGS)
+    assert cache.get('blob1', 'python') == (RESULTS, None)
+    assert cache.get('blob1', 'javascript') is None
+    cache.close()
+
+    changed = copy.deepcopy(CONFIGS)
+    changed['python']['libraries']['OpenAI']['specific'][0]['pattern'] += r'\s*'
+    cache = ResultCache(path, changed)
+    assert 'Scan patterns changed, dropped 1 cached results' in capsys.readouterr().out
+    assert cache.get('blob1', 'python') is None
+    cache.close()
+    # Dropped rather than kept alongside, so going back to the old patterns misses too
+    assert _cached_blob_ids(path) == []
+
+
+def test_least_recently_used_entries_are_evicted_past_max_entries(tmp_path, clock):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = ResultCache(path, CONFIGS, max_entries=10)
+    for i in range(5):
+        clock[0] += 1
+        cache.record(f'blob{i}', 'python', RESULTS, None, from_cache=False)
+    cache.close()
+    assert _cached_blob_ids(path) == ['blob0', 'blob1', 'blob2', 'blob3', 'blob4']
+
+    cache = ResultCache(path, CONFIGS, max_entries=3)
+    # A hit makes the oldest entry the most recently used one
+    clock[0] += 1
+    cache.record('blob0', 'python', *cache.get('blob0', 'python'), from_cache=True)
+    cache.close()
+    assert _cached_blob_ids(path) == ['blob0', 'blob3', 'blob4']
+
+
+def test_read_only_cache_reads_without_writing(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    with pytest.raises(sqlite3.OperationalError):
+        ResultCache(path, CONFIGS, read_only=True)
+
+    cache = ResultCache(path, CONFIGS, max_entries=1)
+    cache.record('blob1', 'python', RESULTS, None, from_cache=False)
+    cache.record('blob2', 'python', RESULTS, None, from_cache=False)
+    cache.flush()
+
+    # Sees what the writer has flushed while it's still open, as workers do
+    worker_cache = ResultCache(path, CONFIGS, read_only=True)
+    assert worker_cache.get('blob1', 'python') == (RESULTS, None)
+    worker_cache.record('blob3', 'python', RESULTS, None, from_cache=False)
+    worker_cache.close()
+    assert _cached_blob_ids(path) == ['blob1', 'blob2']
+    cache.close()
+    # Only the writer evicts
+    assert len(_cached_blob_ids(path)) == 1
+
+
+def test_parallel_scan_serves_workers_from_cache(tmp_path, monkeypatch, make_git_repo):
+    monkeypatch.chdir(tmp_path)
+    repo = make_git_repo(str(tmp_path / 'repo'), {f'app{i}.py': OPENAI_SOURCE + f'# {i}\n' for i in range(5)})
+    path = str(tmp_path / 'cache.sqlite')
+    executor = create_executor(2)
+    try:
+        scans = []
+        for _ in range(2):
+            cache = ResultCache(path, CONFIGS)
+            scans.append(scan_repo(repo, executor, cache=cache))
+            scans.append((cache.hits, cache.misses))
+            cache.close()
+    finally:
+        executor.shutdown()
+    first_stats, first_counts, second_stats, second_counts = scans
+    assert first_counts == (0, 5)
+    assert second_counts == (5, 0)
+    assert second_stats == first_stats
+
+
+def test_results_cached_before_a_failed_scan_are_kept(tmp_path, monkeypatch, make_git_repo):
+    monkeypatch.chdir(tmp_path)
+    repos = [make_git_repo(str(tmp_path / name), {'app.py': OPENAI_SOURCE}) for name in ('repo0', 'repo1')]
+    path = str(tmp_path / 'cache.sqlite')
+    scan_repo_to_run = sprawl.scan_repo_to_run
+
+    def scan_then_fail(run, repo, *args, **kwargs):
+        if repo == repos[1]:
+            raise RuntimeError('scan failed')
+        scan_repo_to_run(run, repo, *args, **kwargs)
+
+    monkeypatch.setattr(sprawl, 'scan_repo_to_run', scan_then_fail)
+    with pytest.raises(RuntimeError):
+        sprawl.run_llm_usage_scanner(repos, cache_path=path)
+    assert len(_cached_blob_ids(path)) == 1
@@ -0,0 +1,79 @@
+import os
+import json
+import subprocess
+import pytest
+from llmaudit.diff import diff_refs, run_diff
+from conftest import OPENAI_SOURCE
+
+CALL = 'client.chat.completions.create(model="gpt-4o")'
+
+
+def _git(repo: str, *args: str) -> str:
+    return subprocess.run(['git', '-C', repo, *args], check=True, capture_output=True, text=True).stdout
+
+
+def _commit(repo: str, files: dict, removed: list = (), message: str = 'change'):
+    for path in removed:
+        _git(repo, 'rm', '-q', path)
+    for path, content in files.items():
+        with open(os.path.join(repo, path), 'w') as f:
+            f.write(content)
+        _git(repo, 'add', path)
+    _git(repo, 'commit', '-q', '-m', message)
+
+
+@pytest.fixture
+def repo(tmp_path, make_git_repo):
+    path = make_git_repo(str(tmp_path / 'repo'), {'app.py': OPENAI_SOURCE, 'other.py': OPENAI_SOURCE})
+    _git(path, 'branch', 'base')
+    return path
+
+
+def _sites(findings):
+    return [(finding.file_path, finding.line, text) for finding, text in findings]
+
+
+def test_renamed_file_is_not_reported(repo):
+    _git(repo, 'mv', 'app.py', 'renamed.py')
+    _commit(repo, {'other.py': OPENAI_SOURCE + CALL + '\n'})
+    added, removed = diff_refs(repo, 'base')
+    assert _sites(added) == [('other.py', 4, CALL)]
+    assert removed == []
+
+
+def test_identical_call_sites_are_compared_as_a_multiset(repo):
+    # Moving a call within a file isn't a change, but a second identical one is
+    _commit(repo, {'app.py': '\n\n' + OPENAI_SOURCE + CALL + '\n', 'other.py': 'from openai import OpenAI\n'})
+    added, removed = diff_refs(repo, 'base')
+    assert _sites(added) == [('app.py', 6, CALL)]
+    assert _sites(removed) == [('other.py', 3, CALL)]
+
+
+def test_compares_with_the_merge_base_by_default(repo):
+    _commit(repo, {'new.py': OPENAI_SOURCE}, message='head')
+    _git(repo, 'checkout', '-q', 'base')
+    # Lands on base after head branched off, so it isn't one of head's changes
+    _commit(repo, {'other.py': OPENAI_SOURCE + CALL + '\n'}, message='base')
+    _git(repo, 'checkout', '-q', '-')
+
+    added, removed = diff_refs(repo, 'base')
+    assert _sites(added) == [('new.py', 3, CALL)]
+    assert removed == []
+
+    added, removed = diff_refs(repo, 'base', use_merge_base=False)
+    assert _sites(added) == [('new.py', 3, CALL)]
+    assert _sites(removed) == [('other.py', 4, CALL)]
+
+
+def test_exit_codes(repo, tmp_path, capsys):
+    assert run_diff(repo, 'base', fail_on_added=True) == 0
+    _commit(repo, {'new.py': OPENAI_SOURCE})
+    json_path = str(tmp_path / 'out' / 'diff.json')
+    assert run_diff(repo, 'base', json_path=json_path) == 0
+    assert run_diff(repo, 'base', fail_on_added=True) == 1
+    assert 'Added LLM call sites (1):' in capsys.readouterr().out
+    with open(json_path) as f:
+        assert [(site['file_path'], site['code']) for site in json.load(f)['added']] == [('new.py', CALL)]
+
+    assert run_diff(repo, 'no-such-branch', fail_on_added=True) == 2
+    assert 'no-such-branch is not a commit' in capsys.readouterr().out
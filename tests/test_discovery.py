@@ -0,0 +1,202 @@
+import json
+import time
+import datetime
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from llmaudit import discovery
+from llmaudit.discovery import GitHubClient, RepoLister
+
+
+def _repo(name: str, days_ago: int, **fields) -> dict:
+    pushed_at = datetime.datetime(2026, 1, 31, tzinfo=datetime.timezone.utc) - datetime.timedelta(days=days_ago)
+    return {'name': name, 'clone_url': f'https://example.com/{name}.git', 'pushed_at': pushed_at.isoformat().replace('+00:00', 'Z'),
+            'archived': False, 'fork': False, 'size': 10, 'language': 'Python', **fields}
+
+
+class _StubGitHub:
+    # A local stand-in for the repo list endpoints, serving repos page_size at a time
+    # with Link headers. Queued (status, headers) rejections are answered first, a
+    # status of 'drop' closing the connection without an answer and 'truncate'
+    # closing it partway through the body. Every request's path and query is recorded.
+    def __init__(self, repos, page_size: int = 2, with_last: bool = True):
+        self.repos = repos
+        self.page_size = page_size
+        self.with_last = with_last
+        self.rejections = []
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append(self.path)
+                if stub.rejections:
+                    status, headers = stub.rejections.pop(0)
+                    if status == 'drop':
+                        self.close_connection = True
+                    elif status == 'truncate':
+                        self.send_response(200)
+                        self.send_header('Content-Length', '100')
+                        self.end_headers()
+                        self.wfile.write(b'[{"name": ')
+                        self.close_connection = True
+                    else:
+                        self._send(status, {'message': 'rate limited'}, headers)
+                    return
+                parts = urllib.parse.urlsplit(self.path)
+                query = dict(urllib.parse.parse_qsl(parts.query))
+                page = int(query.get('page', 1))
+                last_page = max(1, -(-len(stub.repos) // stub.page_size))
+                links = []
+                if page < last_page:
+                    links.append(f'<{stub.page_url(parts, query, page + 1)}>; rel="next"')
+                    if stub.with_last:
+                        links.append(f'<{stub.page_url(parts, query, last_page)}>; rel="last"')
+                headers = {'Link': ', '.join(links)} if links else {}
+                self._send(200, stub.repos[(page - 1) * stub.page_size:page * stub.page_size], headers)
+
+            def _send(self, status, body, headers):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def page_url(self, parts, query, page: int) -> str:
+        return f'{self.url}{parts.path}?{urllib.parse.urlencode({**query, "page": page})}'
+
+    def pages_requested(self):
+        return [int(dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(path).query)).get('page', 1)) for path in self.requests]
+
+
+@pytest.fixture
+def stub_github():
+    servers = []
+
+    def start(*args, **kwargs) -> _StubGitHub:
+        servers.append(_StubGitHub(*args, **kwargs))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.server.shutdown()
+        server.server.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Waits are recorded rather than slept, and move a fake clock forward instead
+    recorded = []
+    now = [time.time()]
+
+    def sleep(seconds: float):
+        recorded.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr(discovery.time, 'time', lambda: now[0])
+    monkeypatch.setattr(discovery.time, 'sleep', sleep)
+    return recorded
+
+
+def _names(repos):
+    return [repo['name'] for repo in repos]
+
+
+@pytest.mark.parametrize('with_last', [True, False])
+def test_lists_every_page_in_order(stub_github, with_last):
+    repos = [_repo(f'repo{i}', i) for i in range(7)]
+    stub = stub_github(repos, with_last=with_last)
+    lister = RepoLister(GitHubClient(api_url=stub.url), org='acme', page_workers=3)
+    assert _names(lister.list()) == _names(repos)
+    assert sorted(stub.pages_requested()) == [1, 2, 3, 4]
+    first = urllib.parse.urlsplit(stub.requests[0])
+    assert first.path == '/orgs/acme/repos'
+    # Organizations leave out forks on the server
+    assert dict(urllib.parse.parse_qsl(first.query)) == {'per_page': '100', 'sort': 'pushed', 'direction': 'desc', 'type': 'sources'}
+
+
+def test_filters_repos_and_counts_them(stub_github):
+    repos = [_repo('a', 0), _repo('archived', 1, archived=True), _repo('fork', 2, fork=True), _repo('go', 3, language='Go'),
+             _repo('b', 4, language='python'), _repo('just_pushed', 5, size=0)]
+    stub = stub_github(repos)
+    lister = RepoLister(GitHubClient(api_url=stub.url), user='someone', languages=['Python'])
+    # A size of 0 doesn't mean a repo is empty, GitHub may not have computed it yet
+    assert _names(lister.list()) == ['a', 'b', 'just_pushed']
+    assert lister.skipped == {'archived': 1, 'fork': 1, 'language': 1}
+    assert urllib.parse.urlsplit(stub.requests[0]).path == '/users/someone/repos'
+
+    stub.requests.clear()
+    lister = RepoLister(GitHubClient(api_url=stub.url), user='someone', include_archived=True, include_forks=True)
+    assert _names(lister.list()) == _names(repos)
+
+
+def test_stops_at_first_repo_pushed_before_pushed_since(stub_github):
+    repos = [_repo(f'repo{i}', i) for i in range(10)]
+    stub = stub_github(repos)
+    pushed_since = datetime.datetime(2026, 1, 31, tzinfo=datetime.timezone.utc) - datetime.timedelta(days=2, hours=12)
+    lister = RepoLister(GitHubClient(api_url=stub.url), org='acme', pushed_since=pushed_since, page_workers=1)
+    assert _names(lister.list()) == ['repo0', 'repo1', 'repo2']
+    assert lister.reached_pushed_since
+    # The pages after the cutoff's are never fetched
+    assert stub.pages_requested() == [1, 2]
+
+
+def test_waits_and_retries_when_rate_limited(stub_github, sleeps):
+    repos = [_repo(f'repo{i}', i) for i in range(3)]
+    stub = stub_github(repos)
+    stub.rejections = [(403, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(int(time.time()) + 30)}),
+                       (429, {'Retry-After': '20'})]
+    lister = RepoLister(GitHubClient(api_url=stub.url), org='acme', page_workers=1)
+    assert _names(lister.list()) == _names(repos)
+    assert len(sleeps) == 2 and 25 < sleeps[0] <= 31 and 15 < sleeps[1] <= 20
+    assert stub.pages_requested() == [1, 1, 1, 2]
+
+
+def test_rate_limit_waits_at_least_a_second_when_reset_has_passed(stub_github, sleeps):
+    stub = stub_github([_repo('repo0', 0)])
+    stub.rejections = [(403, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(int(time.time()) - 100)}),
+                       (429, {'Retry-After': '0'})]
+    lister = RepoLister(GitHubClient(api_url=stub.url), org='acme')
+    assert _names(lister.list()) == ['repo0']
+    # The second rejection in a row backs off further
+    assert len(sleeps) == 2 and 0.9 < sleeps[0] <= 1 and 1.9 < sleeps[1] <= 2
+
+
+def test_gives_up_when_rate_limited_too_many_times_in_a_row(stub_github, sleeps):
+    stub = stub_github([_repo('repo0', 0)])
+    stub.rejections = [(429, {'Retry-After': '0'})] * 5
+    lister = RepoLister(GitHubClient(api_url=stub.url, max_rate_limit_retries=3), org='acme')
+    with pytest.raises(discovery.GitHubError, match='still rate limited after 3 retries'):
+        list(lister.list())
+    assert len(stub.requests) == 4
+    assert [round(seconds) for seconds in sleeps] == [1, 2, 4]
+
+
+def test_retries_dropped_connections_and_truncated_responses(stub_github, sleeps):
+    repos = [_repo(f'repo{i}', i) for i in range(3)]
+    stub = stub_github(repos)
+    stub.rejections = [('drop', {}), ('truncate', {})]
+    lister = RepoLister(GitHubClient(api_url=stub.url), org='acme', page_workers=1)
+    assert _names(lister.list()) == _names(repos)
+    assert sleeps == [1, 2]
+    assert stub.pages_requested() == [1, 1, 1, 2]
+
+
+def test_gives_up_on_dropped_connections_as_github_error(stub_github, sleeps):
+    stub = stub_github([_repo('repo0', 0)])
+    stub.rejections = [('drop', {})] * 5
+    lister = RepoLister(GitHubClient(api_url=stub.url, max_retries=2), org='acme')
+    with pytest.raises(discovery.GitHubError, match='RemoteDisconnected'):
+        list(lister.list())
+    assert len(stub.requests) == 3
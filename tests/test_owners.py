@@ -0,0 +1,60 @@
+import random
+from codeowners import CodeOwners
+from llmaudit.owners import OwnersIndex
+
+NAMES = ['src', 'docs', 'api', 'web', 'lib', 'README.md', 'main.py', 'app.js', 'util.ts', 'my file.py', 'a b']
+EXTENSIONS = ['py', 'js', 'ts', 'md', 'go']
+OWNERS = ['@alice', '@bob', '@org/team', 'dev@example.com']
+
+
+def _random_path(rng: random.Random) -> str:
+    components = [rng.choice(NAMES) for _ in range(rng.randint(0, 3))]
+    components.append(rng.choice(NAMES[5:]) if rng.random() < 0.5 else f"{rng.choice(NAMES)}.{rng.choice(EXTENSIONS)}")
+    return '/'.join(components)
+
+
+def _escaped(name: str) -> str:
+    # CODEOWNERS escapes spaces in paths with a backslash
+    return name.replace(' ', '\\ ')
+
+
+def _random_rule_path(rng: random.Random) -> str:
+    kind = rng.randrange(8)
+    name = _escaped(rng.choice(NAMES))
+    if kind == 0:
+        return '*'
+    if kind == 1:
+        return f'*.{rng.choice(EXTENSIONS)}'
+    if kind == 2:
+        return name
+    if kind == 3:
+        # Directory-only
+        return name + '/'
+    if kind == 4:
+        # Anchored
+        return '/' + name + rng.choice(['', '/', '/*', '/**'])
+    if kind == 5:
+        return f"{name}/{_escaped(rng.choice(NAMES))}"
+    if kind == 6:
+        return f"{rng.choice(['', '/'])}{name}/**/{rng.choice(['*.' + rng.choice(EXTENSIONS), rng.choice(NAMES[:5])])}"
+    plain = rng.choice(NAMES[:5])
+    return f"{rng.choice(['*', plain[:2] + '*', '?' + plain[1:], '[a-m]*'])}{rng.choice(['', '/'])}"
+
+
+def _random_codeowners(rng: random.Random) -> str:
+    lines = []
+    for _ in range(rng.randint(1, 30)):
+        if rng.random() < 0.05:
+            lines.append(f'[Section {len(lines)}]')
+        lines.append(f"{_random_rule_path(rng)} {' '.join(rng.sample(OWNERS, rng.randint(0, 2)))}")
+    return '\n'.join(lines) + '\n'
+
+
+def test_owners_index_matches_codeowners():
+    rng = random.Random(9)
+    for _ in range(400):
+        codeowners = CodeOwners(_random_codeowners(rng))
+        index = OwnersIndex(codeowners)
+        for _ in range(200):
+            path = _random_path(rng)
+            assert index.of(path) == codeowners.of(path), (path, codeowners.paths)
@@ -0,0 +1,60 @@
+import os
+import csv
+import json
+import pytest
+from llmaudit import sprawl
+from llmaudit.runs import DEFAULT_RUNS_DIR, RunStore, latest_run
+from conftest import OPENAI_SOURCE
+
+
+def _results_files(results_path: str):
+    with open(results_path, newline='') as f:
+        return sorted(row['File Path'] for row in csv.DictReader(f))
+
+
+def test_resumed_run_skips_recorded_repos_and_rescans_aborted_ones(tmp_path, monkeypatch, make_git_repo):
+    monkeypatch.chdir(tmp_path)
+    repos = [make_git_repo(str(tmp_path / 'repo0'), {'app.py': OPENAI_SOURCE}),
+             make_git_repo(str(tmp_path / 'repo1'), {'a.py': OPENAI_SOURCE, 'b.py': OPENAI_SOURCE})]
+    scan_repo = sprawl.scan_repo
+    scanned = []
+
+    def killed_partway(repo, *args, sinks=None, **kwargs):
+        # Writes repo1's findings, then dies like a killed process would, before the
+        # repo is committed or its temporary directory cleared
+        stats = scan_repo(repo, *args, sinks=sinks, **kwargs)
+        scanned.append(repo)
+        if repo == repos[1]:
+            for sink in sinks:
+                sink.close()
+            raise KeyboardInterrupt
+        return stats
+
+    monkeypatch.setattr(sprawl, 'scan_repo', killed_partway)
+    monkeypatch.setattr(RunStore, 'abort_repo', lambda self, repo, sinks: None)
+    with pytest.raises(KeyboardInterrupt):
+        sprawl.run_llm_usage_scanner(repos)
+    assert scanned == repos
+
+    run_dir = latest_run(DEFAULT_RUNS_DIR, unfinished=True)
+    assert sorted(name.endswith('.tmp') for name in os.listdir(os.path.join(run_dir, 'repos'))) == [False, True]
+    interrupted = RunStore(run_dir)
+    assert list(interrupted.completed) == [repos[0]]
+    assert interrupted.stats.total_usages == 1
+
+    monkeypatch.undo()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sprawl, 'scan_repo', lambda repo, *args, **kwargs: scanned.append(repo) or scan_repo(repo, *args, **kwargs))
+    scanned.clear()
+    sprawl.run_llm_usage_scanner(repos, resume='latest')
+    assert scanned == [repos[1]]
+
+    assert os.listdir(DEFAULT_RUNS_DIR) == [os.path.basename(run_dir)]
+    assert not [name for name in os.listdir(os.path.join(run_dir, 'repos')) if name.endswith('.tmp')]
+    with open(os.path.join(run_dir, 'manifest.json')) as f:
+        assert json.load(f)['finished']
+    assert _results_files(os.path.join('results', 'results.csv')) == [os.path.join(repos[0], 'app.py'), os.path.join(repos[1], 'a.py'),
+                                                                      os.path.join(repos[1], 'b.py')]
+    resumed = RunStore(run_dir)
+    assert sorted(resumed.completed) == repos
+    assert resumed.stats.total_usages == 3
@@ -0,0 +1,109 @@
+import os
+import csv
+import time
+import threading
+import pytest
+from llmaudit import scan_github_repos, sprawl
+from conftest import OPENAI_SOURCE
+
+
+def _bare_repos(tmp_path, make_git_repo, count: int):
+    # (name, file:// clone url) of count bare repos, each with one OpenAI call
+    targets = []
+    for i in range(count):
+        path = make_git_repo(str(tmp_path / 'remotes' / f'repo{i}.git'), {'app.py': OPENAI_SOURCE}, bare=True)
+        targets.append((f'repo{i}', 'file://' + path))
+    return targets
+
+
+def _scanned_files(results_path: str):
+    with open(results_path, newline='') as f:
+        return sorted(row['File Path'] for row in csv.DictReader(f))
+
+
+class _InFlightTracker:
+    # Wraps cloning and scanning to record how many repos were cloning or waiting to
+    # be scanned at once, and what was left on disk after each scan
+    def __init__(self, monkeypatch, clone_seconds: float):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.left_after_scan = []
+        self._lock = threading.Lock()
+        clone_repo = scan_github_repos._clone_repo
+        scan_repo_to_run = sprawl.scan_repo_to_run
+
+        def slow_clone(*args, **kwargs):
+            with self._lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            time.sleep(clone_seconds)
+            return clone_repo(*args, **kwargs)
+
+        def tracked_scan(run, repo, *args, **kwargs):
+            scan_repo_to_run(run, repo, *args, **kwargs)
+            self.left_after_scan.append(os.path.exists(repo))
+            with self._lock:
+                self.in_flight -= 1
+
+        monkeypatch.setattr(scan_github_repos, '_clone_repo', slow_clone)
+        monkeypatch.setattr(sprawl, 'scan_repo_to_run', tracked_scan)
+
+
+def test_clone_and_scan_caps_in_flight_and_deletes_scanned_repos(tmp_path, monkeypatch, make_git_repo):
+    targets = _bare_repos(tmp_path, make_git_repo, 6)
+    monkeypatch.chdir(tmp_path)
+    tracker = _InFlightTracker(monkeypatch, clone_seconds=0.2)
+    temp_dir = str(tmp_path / 'temp')
+    os.makedirs(temp_dir)
+
+    scan_github_repos.clone_and_scan(targets, temp_dir, keep_folder=False, timeout=60, clone_workers=4, max_in_flight=2)
+
+    assert tracker.max_in_flight == 2
+    assert tracker.left_after_scan == [False] * 6
+    assert not os.path.exists(temp_dir)
+    assert _scanned_files(os.path.join('results', 'results.csv')) == sorted(
+        os.path.join(temp_dir, f'repo{i}', 'app.py') for i in range(6))
+
+
+def test_clone_and_scan_keeps_repos(tmp_path, monkeypatch, make_git_repo):
+    targets = _bare_repos(tmp_path, make_git_repo, 3)
+    monkeypatch.chdir(tmp_path)
+    tracker = _InFlightTracker(monkeypatch, clone_seconds=0)
+    temp_dir = str(tmp_path / 'temp')
+    os.makedirs(temp_dir)
+
+    scan_github_repos.clone_and_scan(targets, temp_dir, keep_folder=True, timeout=60, max_in_flight=8)
+
+    assert tracker.left_after_scan == [True] * 3
+    assert sorted(os.listdir(temp_dir)) == ['repo0', 'repo1', 'repo2']
+    assert os.path.isfile(os.path.join(temp_dir, 'repo0', 'app.py'))
+
+
+@pytest.mark.parametrize('clone_strategy', list(scan_github_repos.CLONE_STRATEGIES))
+def test_clone_strategies_scan_committed_files_gitignore_matches(tmp_path, monkeypatch, make_git_repo, clone_strategy):
+    path = make_git_repo(str(tmp_path / 'remotes' / 'repo.git'), {'.gitignore': 'gen/\n', 'gen/g.py': OPENAI_SOURCE,
+                                                                  'app.py': OPENAI_SOURCE}, bare=True)
+    monkeypatch.chdir(tmp_path)
+    temp_dir = str(tmp_path / 'temp')
+    os.makedirs(temp_dir)
+
+    scan_github_repos.clone_and_scan([('repo', 'file://' + path)], temp_dir, keep_folder=False, timeout=60,
+                                     clone_strategy=clone_strategy)
+
+    assert _scanned_files(os.path.join('results', 'results.csv')) == [os.path.join(temp_dir, 'repo', 'app.py'),
+                                                                      os.path.join(temp_dir, 'repo', 'gen', 'g.py')]
+
+
+@pytest.mark.parametrize('mirror', [False, True])
+def test_clone_and_scan_counts_empty_repos(tmp_path, monkeypatch, make_git_repo, capsys, mirror):
+    targets = _bare_repos(tmp_path, make_git_repo, 1)
+    targets.append(('empty', 'file://' + make_git_repo(str(tmp_path / 'remotes' / 'empty.git'), {}, bare=True)))
+    monkeypatch.chdir(tmp_path)
+    temp_dir = str(tmp_path / 'temp')
+    os.makedirs(temp_dir)
+
+    scan_github_repos.clone_and_scan(targets, temp_dir, keep_folder=False, timeout=60,
+                                     mirror_dir=str(tmp_path / 'mirrors') if mirror else None)
+
+    assert 'Empty repositories, with no commits to scan: 1' in capsys.readouterr().out
+    assert len(_scanned_files(os.path.join('results', 'results.csv'))) == 1
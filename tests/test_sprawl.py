@@ -0,0 +1,199 @@
+import os
+import re
+import csv
+import mmap
+import random
+from typing import List
+import pytest
+from llmaudit import sprawl
+from llmaudit.findings import close_sinks, open_sinks
+from llmaudit.sprawl import LLMUsageScanner, create_executor, scan_repo
+from conftest import OPENAI_SOURCE
+
+# Fragments random files are built from, imports and inits by language. Several can
+# land on one line, so exact matches (calls on a client variable) and non-exact ones
+# of other libraries collide.
+IMPORTS = {
+    'python': ['import openai', 'from openai import OpenAI', 'import anthropic', 'from mistralai.client import MistralClient'],
+    'javascript': ["import OpenAI from 'openai';", 'const OpenAI = require("openai");',
+                   "import Anthropic from '@anthropic-ai/sdk';", "const MistralClient = require('@mistralai/mistralai');"],
+}
+INITS = {
+    'python': ['client = OpenAI()', 'claude = anthropic.Anthropic()', 'mistral = MistralClient(api_key=key)'],
+    'javascript': ['const client = new OpenAI();', 'const claude = new Anthropic({apiKey});',
+                   'const mistral = new MistralClient(key);'],
+}
+CALLS = [
+    'client.chat.completions.create(', 'chat.completions.create(', 'client.embeddings.create(', 'embeddings.create(',
+    'claude.messages.create(', 'messages.create(', 'messages.stream(', 'claude.completions.create(', 'completions.create(',
+    'mistral.chat(', 'chat(', 'mistral.chat_stream(', 'mistral.embeddings(', 'embeddings(',
+    'x = 1', '# nothing here', '',
+]
+
+
+class _ReferenceScanner:
+    # The result bookkeeping _find_usage had before line numbers came from newline
+    # offsets and conflicts from the set of exact lines: every earlier result of the
+    # file is searched for each match, and an exact match evicts the latest non-exact
+    # result on its line from results_by_file.
+    def __init__(self):
+        self.results = []
+        self.results_by_file = []
+
+    def _prev_results_has_conflicting_exact_match(self, line_number: int, curr_match_is_exact: bool) -> bool:
+        index_to_delete = None
+        for index, prev_res in enumerate(self.results_by_file):
+            if prev_res[0] == line_number and prev_res[3]:
+                return True
+            if prev_res[0] == line_number and not prev_res[3]:
+                if curr_match_is_exact:
+                    index_to_delete = index
+        if index_to_delete is not None:
+            del self.results_by_file[index_to_delete]
+        return False
+
+    def find_usage(self, content: str, starts: List[int], pattern: str, library: str, label: str, exact_match: bool) -> bool:
+        found = False
+        for start in starts:
+            found = True
+            line_number = content.count('\n', 0, start) + 1
+            has_conflicting_match = self._prev_results_has_conflicting_exact_match(line_number, exact_match)
+            if has_conflicting_match and not exact_match:
+                return False
+            result = (line_number, pattern, label, exact_match, library)
+            self.results_by_file.append(result)
+            self.results.append(result)
+        return found
+
+
+def _reference_results(scanner: LLMUsageScanner, content: str, language: str) -> List[tuple]:
+    # The matching _scan_file did before PatternMatcher: each library's import and init
+    # patterns searched for separately, then each of its specific patterns, with the
+    # client's variable name filled in, run over the whole file
+    reference = _ReferenceScanner()
+    for library, patterns in scanner.language_configs[language]['libraries'].items():
+        if not re.search(patterns['import_pattern'], content):
+            continue
+        match = re.search(patterns['init_pattern'], content)
+        var_name = match.group(1) if match else ''
+        for specific in patterns['specific']:
+            pattern = specific['pattern'].format(var_name=var_name)
+            starts = [match.start() for match in re.finditer(pattern, content)]
+            reference.find_usage(content, starts, pattern, library, specific['name'], var_name != '')
+    return reference.results
+
+
+def _random_file(rng: random.Random, language: str = 'python') -> str:
+    lines = rng.sample(IMPORTS[language], rng.randint(1, len(IMPORTS[language])))
+    lines += rng.sample(INITS[language], rng.randint(0, len(INITS[language])))
+    for _ in range(rng.randint(1, 25)):
+        lines.append(' '.join(rng.choice(CALLS) + ')' for _ in range(rng.randint(1, 3))))
+    rng.shuffle(lines)
+    return '\n'.join(lines) + rng.choice(['', '\n'])
+
+
+@pytest.mark.parametrize('language', ['python', 'javascript'])
+def test_results_match_reference_implementation(language):
+    scanner = LLMUsageScanner('.')
+    rng = random.Random(6)
+    collisions = 0
+    for _ in range(3000):
+        content = _random_file(rng, language)
+        results, skip_reason = scanner._match_data(content.encode('utf-8'), language)
+        assert skip_reason is None
+        assert results == _reference_results(scanner, content, language), content
+        lines = [line for line, *_ in results]
+        collisions += len(lines) != len(set(lines))
+    # Enough files have several results on one line for the conflict rules to matter
+    assert collisions > 1000
+
+
+def _find_usage(scanner: LLMUsageScanner, newline_offsets: List[int], starts: List[int], library: str, exact_match: bool) -> bool:
+    return scanner._find_usage(newline_offsets, starts, 'pattern', library, 'label', exact_match)
+
+
+def test_exact_match_drops_later_non_exact_matches_on_its_line():
+    scanner = LLMUsageScanner('.')
+    content = 'a b\nc d\ne f\n'
+    newline_offsets = scanner._get_newline_offsets(content)
+    # Starts a new file's results
+    scanner._match_data(b'', 'python')
+    assert _find_usage(scanner, newline_offsets, [2], 'OpenAI', True)
+    # Starts on line 1 then line 3: the first conflicts, so the rest are dropped too
+    assert not _find_usage(scanner, newline_offsets, [0, 8], 'Anthropic', False)
+    # A later exact match on the same line is kept alongside the first
+    assert _find_usage(scanner, newline_offsets, [0], 'Mistral', True)
+    assert scanner._file_results == [(1, 'pattern', 'label', True, 'OpenAI'), (1, 'pattern', 'label', True, 'Mistral')]
+
+
+def test_non_exact_match_is_kept_when_exact_match_follows_on_its_line():
+    scanner = LLMUsageScanner('.')
+    content = 'a b\nc d\n'
+    newline_offsets = scanner._get_newline_offsets(content)
+    # Starts a new file's results
+    scanner._match_data(b'', 'python')
+    assert _find_usage(scanner, newline_offsets, [4, 0], 'Anthropic', False)
+    assert _find_usage(scanner, newline_offsets, [6], 'Mistral', True)
+    # Line 1 has no exact match, so non-exact matches there are still kept
+    assert _find_usage(scanner, newline_offsets, [1], 'OpenAI', False)
+    assert not _find_usage(scanner, newline_offsets, [5], 'OpenAI', False)
+    assert scanner._file_results == [(2, 'pattern', 'label', False, 'Anthropic'), (1, 'pattern', 'label', False, 'Anthropic'),
+                                     (2, 'pattern', 'label', True, 'Mistral'), (1, 'pattern', 'label', False, 'OpenAI')]
+
+
+def _scan_rows(repo: str, results_dir: str, executor, git_ref: str):
+    sinks = open_sinks(['csv'], results_dir)
+    stats = scan_repo(repo, executor, sinks=sinks, git_ref=git_ref)
+    close_sinks(sinks)
+    with open(os.path.join(results_dir, 'results.csv'), newline='') as f:
+        return list(csv.reader(f)), stats
+
+
+@pytest.mark.parametrize('git_ref', [None, 'HEAD'])
+def test_parallel_scan_matches_serial_scan(tmp_path, make_git_repo, git_ref):
+    rng = random.Random(2)
+    files = {f'src/mod{i}/file{i}.py': _random_file(rng) for i in range(40)}
+    files['web/app.js'] = "import OpenAI from 'openai';\nconst client = new OpenAI();\nclient.chat.completions.create({});\n"
+    files['CODEOWNERS'] = '*.py @python-team\n/src/mod1/ @mod1-team\n'
+    repo = make_git_repo(str(tmp_path / 'repo'), files)
+
+    serial_rows, serial_stats = _scan_rows(repo, str(tmp_path / 'serial'), None, git_ref)
+    executor = create_executor(2)
+    try:
+        parallel_rows, parallel_stats = _scan_rows(repo, str(tmp_path / 'parallel'), executor, git_ref)
+    finally:
+        executor.shutdown()
+    assert len(serial_rows) > 100
+    assert parallel_rows == serial_rows
+    assert parallel_stats == serial_stats
+
+
+class _NoMmap(mmap.mmap):
+    # Stands in for mmap.mmap on a file that can't be mapped
+    def __new__(cls, *args, **kwargs):
+        raise OSError('cannot map')
+
+
+def _match_file(tmp_path, content: bytes):
+    path = tmp_path / 'app.py'
+    path.write_bytes(content)
+    compact_results, skip_reason, (_, _, size) = LLMUsageScanner(str(tmp_path))._match_file(str(path), 'python')
+    return compact_results, skip_reason, size
+
+
+@pytest.mark.parametrize('split', range(6))
+@pytest.mark.parametrize('has_import', [True, False])
+def test_chunked_read_matches_whole_file_read(tmp_path, monkeypatch, split, has_import):
+    # The only 'openai' in the file, that of the import, starts split bytes before the
+    # end of the second chunk
+    source = OPENAI_SOURCE if has_import else OPENAI_SOURCE.replace('openai', 'OpenAi')
+    content = ('#' * (128 - split - len('from ') - 1) + '\n' + source + 'x = 1\n' * 50).encode('utf-8')
+    expected = _match_file(tmp_path, content)
+    assert expected[2] == len(content)
+    assert bool(expected[0]) == has_import
+
+    monkeypatch.setattr(sprawl, 'MMAP_MIN_SIZE', 1)
+    monkeypatch.setattr(sprawl, 'READ_CHUNK_SIZE', 64)
+    assert _match_file(tmp_path, content) == expected
+    monkeypatch.setattr(sprawl.mmap, 'mmap', _NoMmap)
+    assert _match_file(tmp_path, content) == expected
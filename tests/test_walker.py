@@ -0,0 +1,70 @@
+import os
+import subprocess
+import git
+import pytest
+from llmaudit.gitobjects import list_tree
+from llmaudit.walker import FileWalker
+
+FILES = ['app.py', 'src/main.py', 'src/gen/a.py', 'src/gen/keep.py', 'src/gen/deep/b.py', 'logs/x.py', 'pkg/logs/y.py',
+         'docs/conf.py', 'docs/api/ref.py', 'tmp.py/inner.py']
+
+# .gitignore contents checked against git itself, the last few being ones where a
+# pattern matching everything in a directory must not prune the directory itself
+GITIGNORES = [
+    'logs/\n',
+    '/logs\n',
+    'src/gen/\n!src/gen/keep.py\n',
+    'tmp.py\n',
+    '*.py\n!src/\n!src/*.py\n',
+    'src/gen/*\n!src/gen/keep.py\n',
+    'src/gen/**\n!src/gen/keep.py\n',
+    'src/gen/*/\n',
+    'docs/*\n!docs/api/\n',
+    '**/logs/*\n!pkg/logs/y.py\n',
+]
+
+
+def _write_files(root: str, files: dict):
+    for path, content in files.items():
+        full_path = os.path.join(root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'w') as f:
+            f.write(content)
+
+
+def _walked(walker: FileWalker):
+    return sorted(os.path.relpath(path, walker.root_dir).replace(os.sep, '/') for path in walker.walk())
+
+
+@pytest.mark.parametrize('committed', [[], ['src/gen/a.py', 'src/gen/deep/b.py', 'logs/x.py', 'docs/api/ref.py']])
+@pytest.mark.parametrize('gitignore', GITIGNORES)
+def test_walk_applies_gitignore_like_git(tmp_path, make_git_repo, gitignore, committed):
+    # Committed files are never ignored, even in ignored directories, and everything
+    # else git lists is scanned
+    root = make_git_repo(str(tmp_path / 'repo'), {path: '' for path in committed},
+                         untracked={path: '' for path in FILES if path not in committed})
+    _write_files(root, {'.gitignore': gitignore})
+    listed = subprocess.run(['git', '-C', root, 'ls-files', '-co', '--exclude-standard'], check=True, capture_output=True,
+                            text=True).stdout.split()
+    assert _walked(FileWalker(root, ['.py'])) == sorted(path for path in listed if path.endswith('.py'))
+
+
+def test_exclude_patterns_only_prune_matching_directories(tmp_path):
+    root = str(tmp_path)
+    _write_files(root, {path: '' for path in FILES})
+    walker = FileWalker(root, ['.py'], exclude=['docs/*', 'src/gen/**', '!src/gen/keep.py'])
+    assert _walked(walker) == ['app.py', 'logs/x.py', 'pkg/logs/y.py', 'src/gen/keep.py', 'src/main.py', 'tmp.py/inner.py']
+
+    entries = [(path, path, 0) for path in FILES]
+    walker = FileWalker(root, ['.py'], exclude=['docs/*', 'src/gen/**', '!src/gen/keep.py'])
+    assert sorted(path for path, _ in walker.walk_tree(entries)) == _walked(walker)
+
+
+def test_walk_tree_scans_committed_files_gitignore_matches(tmp_path, make_git_repo):
+    # Force-added files and committed build output are still committed code
+    path = make_git_repo(str(tmp_path / 'repo'), {'.gitignore': 'src/gen/\n*.log.py\n', 'src/gen/g.py': '', 'b/.gitignore': 'logs/\n',
+                                                  'b/logs/y.py': '', 'b/run.log.py': '', 'app.py': '', 'node_modules/m/i.py': ''})
+    walker = FileWalker(path, ['.py'], exclude=['app.py'])
+    paths = sorted(tree_path for tree_path, _ in walker.walk_tree(list_tree(git.Repo(path), 'HEAD')))
+    assert paths == ['b/logs/y.py', 'b/run.log.py', 'src/gen/g.py']
+    assert walker.summary() == '1 dirs (default excludes), 1 files (exclude patterns)'